@@ -1,11 +1,16 @@
 from flask.views import MethodView
 from flask_smorest import Blueprint
 from models.user import User
-from schemas import UserSchema, AdminChangePasswordSchema
+from models.principal import invalidate_principals
+from models.audit import AuditLog, audit
+from schemas import UserSchema, UserListArgsSchema, AdminChangePasswordSchema, AuditLogArgsSchema, AuditLogSchema
 from utils import db
-from werkzeug.security import check_password_hash, generate_password_hash
+from utils.passwords import check_password, hash_password
 from flask_jwt_extended import jwt_required
-from utils import admin_required, super_admin_required
+from flask import jsonify
+from utils import admin_required, super_admin_required, keyset_paginate, pagination_header
+from utils.db import pool_status
+from utils.ratelimit import rate_limit
 from http import HTTPStatus
 
 blp = Blueprint("admins", __name__, description="Operations on admins")
@@ -15,6 +20,7 @@ class AdminChangePassword(MethodView):
     @blp.arguments(AdminChangePasswordSchema)
     @blp.doc(description="Change admin password. Can be accessed by only an admin")
     # @blp.response(200, UserSchema)
+    @rate_limit("change_password", account="email")
     def put(self, user_data):
         """
         Admin change password route
@@ -22,10 +28,10 @@ class AdminChangePassword(MethodView):
         user = User.query.filter_by(email=user_data["email"]).first()
 
         # checks if user exists and password matches
-        if user and check_password_hash(user.password, user_data["password"]):
+        if user and check_password(user.password, user_data["password"]):
             # check if the new_password field and confirm_new_password field is the same
             if user_data["new_password"] == user_data["confirm_new_password"]:
-                user.password = generate_password_hash(user_data["new_password"])
+                user.password = hash_password(user_data["new_password"])
                 db.session.commit()
                 return {
                     "message": "Password successfully changed. Proceed to login"
@@ -42,18 +48,35 @@ blp.add_url_rule("/admin/change_password", methods=["PUT"], view_func=my_view)
 
 @blp.route("/admin")
 class AdminList(MethodView):
-    @blp.response(200, UserSchema(many=True))
+    @blp.arguments(UserListArgsSchema, location="query")
+    @blp.alt_response(200, schema=UserSchema(many=True), success=True)
     @blp.doc(
-        description="Retrieve all administrators. This method can be accessed by only an admin"
+        description="Retrieve administrators a page at a time. This method can be accessed by only an admin."
+        " The cursor of the next page is returned in the X-Pagination header."
+        " Pick the fields returned with fields=id,email and add the courses with include=courses"
     )
     @jwt_required()
     @admin_required()
-    def get(self):
+    def get(self, args):
         """
         Get all administrators
         """
-        admins = User.query.filter(User.is_admin == True)
-        return admins, HTTPStatus.OK
+        options = User.field_options(args.get("only_fields"), args["include"], *User.sort_columns(args["sort"]))
+        query = User.query.options(*options).filter(User.is_admin == True)
+        if "enrollment_status" in args:
+            query = query.filter(User.enrollment_status == args["enrollment_status"])
+        admins, next_cursor = keyset_paginate(
+            query,
+            User.sort_columns(args["sort"]),
+            args["limit"],
+            cursor=args.get("cursor"),
+            descending=args["order"] == "desc",
+        )
+        return (
+            jsonify(UserSchema.for_args(args, many=True).dump(admins)),
+            HTTPStatus.OK,
+            pagination_header(next_cursor, args["limit"]),
+        )
 
 
 @blp.route("/admin/<int:admin_id>")
@@ -72,5 +95,48 @@ class Admin(MethodView):
 
         db.session.delete(user)
         db.session.commit()
+        invalidate_principals(admin_id)
+        audit("delete", "admin", admin_id)
 
         return {"message": "Admin deleted"}, HTTPStatus.OK
+
+
+@blp.route("/admin/audit")
+class AuditLogList(MethodView):
+    @blp.arguments(AuditLogArgsSchema, location="query")
+    @blp.response(200, AuditLogSchema(many=True))
+    @blp.doc(
+        description="Retrieve the audit log of admin actions, newest first, a page at a time. Can be accessed by only an admin."
+        " Filter by actor_id, action or target. The cursor of the next page is returned in the X-Pagination header"
+    )
+    @jwt_required()
+    @admin_required()
+    def get(self, args):
+        """
+        Get the audit log
+        """
+        query = AuditLog.query
+        for column in ("actor_id", "action", "target_type", "target_id"):
+            if column in args:
+                query = query.filter(getattr(AuditLog, column) == args[column])
+        events, next_cursor = keyset_paginate(
+            query, (AuditLog.id,), args["limit"], cursor=args.get("cursor"), descending=True
+        )
+        return events, HTTPStatus.OK, pagination_header(next_cursor, args["limit"])
+
+
+@blp.route("/admin/db-pool")
+class DatabasePool(MethodView):
+    @blp.doc(
+        description="Report the database connection pool of the worker serving the request: connections checked out,"
+        " overflow, time waited for a free connection and pool timeouts. Every worker has a pool of its own, so the"
+        " numbers cover only that worker and not the others."
+        " Can be accessed by only an admin"
+    )
+    @jwt_required()
+    @admin_required()
+    def get(self):
+        """
+        Get database pool telemetry
+        """
+        return pool_status(), HTTPStatus.OK
@@ -1,3 +1,5 @@
+import threading
+import click
 from flask import Flask, jsonify
 from flask_smorest import Api
 from config import config_dict
@@ -6,13 +8,23 @@ from courses import blp as CourseBlueprint
 from student import blp as StudentBlueprint
 from admin import blp as AdminBlueprint
 from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
 from utils import db, mail
+from utils.db import configure_engine
 from models.courses import Course
 from models.user import User
 from models.scores import Score
 from models.blocklist import TokenBlocklist
+from models.cache import CacheVersion
+from models.grading import GradingScheme, GradeBoundary
+from models.waitlist import CourseWaitlist
+from models.student_id import StudentIdCounter
+from models.rate_limit import RateLimitBucket, DatabaseBucketBackend
+from models.audit import AuditLog
+from models.principal import super_admin_id
+from models.outbox import EmailOutbox, run_outbox_sender
+from student.importer import import_report_csv
 from flask_jwt_extended import JWTManager
-from decouple import config as configuration
 
 
 def create_app(config=config_dict["dev"]):
@@ -21,6 +33,7 @@ def create_app(config=config_dict["dev"]):
     app.config.from_object(config)
 
     db.init_app(app)
+    configure_engine(app)
 
     api = Api(app)
 
@@ -30,18 +43,24 @@ def create_app(config=config_dict["dev"]):
 
     migrate = Migrate(app, db)
 
+    if app.config["PROXY_FIX_X_FOR"] or app.config["PROXY_FIX_X_PROTO"]:
+        # client addresses and schemes come from the forwarded headers of the trusted proxies in front of the app
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"], x_proto=app.config["PROXY_FIX_X_PROTO"]
+        )
+
+    if app.config["RATE_LIMIT_BACKEND"] == "database":
+        app.extensions["rate_limit_backend"] = DatabaseBucketBackend(
+            max_age=max(limit[1] for limit in app.config["RATE_LIMITS"].values() if limit)
+        )
+
     @jwt.additional_claims_loader
     def add_claim_to_jwt(identity):
-        email = User.get_by_id(identity).email
-        if email == configuration("EMAIL"):
-            return {"super_admin": True}
-        return {"super_admin": False}
+        return {"super_admin": identity == super_admin_id()}
 
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload: dict) -> bool:
-        jti = jwt_payload["jti"]
-        token = TokenBlocklist.query.filter_by(jti=jti).first()
-        return token is not None
+        return TokenBlocklist.is_revoked(jwt_payload["jti"])
 
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -88,6 +107,54 @@ def create_app(config=config_dict["dev"]):
     api.register_blueprint(StudentBlueprint)
     api.register_blueprint(AdminBlueprint)
 
+    @app.cli.command("rebuild-gpa")
+    @click.option("--check", is_flag=True, help="Only report students whose totals are stale.")
+    def rebuild_gpa(check):
+        """
+        Rebuilds the stored gpa totals from the score table and verifies them
+        """
+        if not check:
+            Score.refresh_gpa()
+            db.session.commit()
+        mismatches = Score.gpa_mismatches()
+        if mismatches:
+            raise click.ClickException(
+                f"GPA totals do not match the scores of {len(mismatches)} users: {mismatches}"
+            )
+        click.echo("GPA totals match the scores")
+
+    @app.cli.command("prune-blocklist")
+    def prune_blocklist():
+        """
+        Deletes blocklist entries of tokens that have expired. Run it on a schedule
+        """
+        click.echo(f"Pruned {TokenBlocklist.prune()} blocklist entries")
+
+    @app.cli.command("send-mail")
+    @click.option("--loop", is_flag=True, help="Keep sending new emails until stopped.")
+    def send_mail(loop):
+        """
+        Sends the emails waiting in the outbox
+        """
+        if loop:
+            run_outbox_sender(app, threading.Event())
+        total = 0
+        while sent := EmailOutbox.send_pending():
+            total += sent
+        click.echo(f"Sent {total} emails")
+
+    @app.cli.command("import-students")
+    @click.argument("file", type=click.File(encoding="utf-8-sig"))
+    @click.option("--report", type=click.File("w"), default="-", help="Where to write the csv report.")
+    @click.option("--base-url", default="http://localhost:5000", help="Url of the api linked in the welcome emails.")
+    def import_students(file, report, base_url):
+        """
+        Registers the students of a csv file with first_name, last_name and email columns
+        """
+        with app.test_request_context(base_url=base_url):
+            for part in import_report_csv(file):
+                report.write(part)
+
     @app.shell_context_processor
     def make_shell_context():
         return {"db": db, "user": User, "course": Course}
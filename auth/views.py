@@ -1,10 +1,11 @@
 from flask.views import MethodView
 from flask_smorest import Blueprint
-from flask import url_for, redirect
+from flask import redirect
 from schemas import PlainUserSchema, StudentLoginSchema, AdminLoginSchema
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils.passwords import hash_password, check_password, password_needs_rehash, default_password
 from models.user import User, EnrollmentStatus
-from utils import db, generate_student_id, mail
+from utils import db
+from models.student_id import generate_student_id
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
@@ -13,38 +14,24 @@ from flask_jwt_extended import (
     get_jwt,
 )
 from models.blocklist import TokenBlocklist
-from datetime import datetime, timezone
+from models.outbox import student_reset_password_email, admin_reset_password_email
+from models.principal import current_principal
 from http import HTTPStatus
 from utils import admin_required, super_admin_required
-from flask_mail import Message
+from utils.ratelimit import rate_limit
 
 blp = Blueprint(
     "auth", __name__, description="Authentication and Authorization Operations"
 )
 
 
-def student_reset_password_email(user, password):
-    msg = Message(
-        "Student Management API Password Reset",
-        sender="noreply@demo.com",
-        recipients=[user.email],
-        body=f"""You are now a student of AltSchool Africa. Congratulations!
-        Your default password is {password}. Please visit the following link to change it
-        {url_for('api-docs.openapi_swagger_ui', _external=True)}""",
-    )
-    mail.send(msg)
-
-
-def admin_reset_password_email(user, password):
-    msg = Message(
-        "Student Management API Password Reset",
-        sender="noreply@demo.com",
-        recipients=[user.email],
-        body=f"""You have been an admin of the Student Management API of AltSchool Africa. Congratulations!
-        Your default password is {password}. Please visit the following link to change it
-        {url_for('api-docs.openapi_swagger_ui', _external=True)}""",
-    )
-    mail.send(msg)
+def upgrade_password_hash(user, password):
+    """
+    Rehashes the password of a user who just logged in if the hash parameters changed
+    """
+    if password_needs_rehash(user.password):
+        user.password = hash_password(password)
+        db.session.commit()
 
 
 @blp.route("/students/signup")
@@ -62,13 +49,13 @@ class StudentRegister(MethodView):
         if user:
             return {"Error": "User exists"}, HTTPStatus.CONFLICT
         # generate the default user password
-        password = (user_data["last_name"] + user_data["first_name"][0:2]).lower()
+        password = default_password(user_data)
         # create new user[student]
         new_user = User(
             first_name=user_data["first_name"],
             last_name=user_data["last_name"],
             email=user_data["email"],
-            password=generate_password_hash(password),
+            password=hash_password(password),
             student_id=generate_student_id(),
         )
         db.session.add(new_user)
@@ -94,13 +81,13 @@ class AdminRegister(MethodView):
         if user:
             return {"Error": "User exists"}, HTTPStatus.CONFLICT
         # generate the default user password
-        password = (user_data["last_name"] + user_data["first_name"][0:2]).lower()
+        password = default_password(user_data)
         # create new user[admin]
         new_user = User(
             first_name=user_data["first_name"],
             last_name=user_data["last_name"],
             email=user_data["email"],
-            password=generate_password_hash(password),
+            password=hash_password(password),
             enrollment_status="ADMIN",
             is_admin=True,
         )
@@ -116,6 +103,7 @@ class StudentLogin(MethodView):
     @blp.doc(
         description="Logs in a student and generates a jwt access token. Student cannot access this route if expelled."
     )
+    @rate_limit("login", account="student_id")
     def post(self, user_data):
         """
         Login a student and generate access token
@@ -123,10 +111,11 @@ class StudentLogin(MethodView):
         user = User.query.filter_by(student_id=user_data["student_id"]).first()
 
         # checks if student exists and if the password entered is the same as the one saved in the database.
-        if user and check_password_hash(user.password, user_data["password"]):
+        if user and check_password(user.password, user_data["password"]):
             # checks if user has been expelled
             if user.enrollment_status == EnrollmentStatus.EXPELLED:
                 return {"Error": "You are no longer a student"}, HTTPStatus.UNAUTHORIZED
+            upgrade_password_hash(user, user_data["password"])
             access_token = create_access_token(
                 identity=user.id,
                 fresh=True,
@@ -146,6 +135,7 @@ class StudentLogin(MethodView):
 class AdminLogin(MethodView):
     @blp.arguments(AdminLoginSchema)
     @blp.doc(description="Logs in an admin and generates a jwt access token")
+    @rate_limit("login", account="email")
     def post(self, user_data):
         """
         Login admin and generate access token
@@ -153,7 +143,8 @@ class AdminLogin(MethodView):
         user = User.query.filter_by(email=user_data["email"]).first()
 
         # checks if admin exists and if the password entered is the same as the one saved in the database.
-        if user.is_admin and check_password_hash(user.password, user_data["password"]):
+        if user and user.is_admin and check_password(user.password, user_data["password"]):
+            upgrade_password_hash(user, user_data["password"])
             access_token = create_access_token(
                 identity=user.id,
                 fresh=True,
@@ -178,7 +169,7 @@ class TokenRefresh(MethodView):
         Generates refresh token
         """
         user_id = get_jwt_identity()
-        user = User.get_by_id(user_id)
+        user = current_principal()
         if user.is_admin:
             access_token = create_access_token(
                 identity=user_id,
@@ -200,8 +191,5 @@ class Logout(MethodView):
         """
         Logout a user and blacklist jwt token
         """
-        jti = get_jwt()["jti"]
-        token = TokenBlocklist(jti=jti, created_at=datetime.now(timezone.utc))
-        db.session.add(token)
-        db.session.commit()
+        TokenBlocklist.revoke(get_jwt()["jti"])
         return {"message": "User successfully logged out"}, HTTPStatus.OK
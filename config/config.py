@@ -1,4 +1,5 @@
 import os
+import tempfile
 from decouple import config
 from datetime import timedelta
 
@@ -20,6 +21,22 @@ class Config:
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=30)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(minutes=30)
     JWT_SECRET_KEY = config("JWT_SECRET_KEY", "topsecret")
+    # how stale the revoked tokens known to a worker can get
+    JWT_REVOCATION_REFRESH_SECONDS = 5
+    # how often every worker deletes the blocklist entries of expired tokens
+    JWT_BLOCKLIST_PRUNE_SECONDS = 3600
+    SUPER_ADMIN_EMAIL = config("EMAIL", None)
+    # how long a worker trusts the role flags it has loaded
+    PRINCIPAL_CACHE_TTL = 30
+    PRINCIPAL_CACHE_SIZE = 1024
+    # stored hashes made with another method are upgraded on the next login
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:600000"
+    # hashing processes of each web worker, the cpus shared out among the WEB_CONCURRENCY workers of the host
+    PASSWORD_HASH_WORKERS = config(
+        "PASSWORD_HASH_WORKERS", max((os.cpu_count() or 1) // config("WEB_CONCURRENCY", 1, cast=int), 1), cast=int
+    )
+    PASSWORD_HASH_QUEUE_SIZE = 64
+    PASSWORD_HASH_TIMEOUT = 10
     API_SPEC_OPTIONS = {
         "security": [{"bearerAuth": []}],
         "components": {
@@ -33,29 +50,84 @@ class Config:
             }
         },
     }
-    MAIL_SERVER = "smtp.googlemail.com"
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    MAIL_SERVER = config("MAIL_SERVER", "smtp.googlemail.com")
+    MAIL_PORT = config("MAIL_PORT", 587, cast=int)
+    MAIL_USE_TLS = config("MAIL_USE_TLS", True, cast=bool)
     MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
     MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
+    # the outbox sender delivers at most MAIL_RATE_LIMIT emails a second per process
+    MAIL_OUTBOX_BATCH_SIZE = 50
+    MAIL_OUTBOX_POLL_SECONDS = 5
+    # how long a claimed batch is left to its sender before others retry it, longer than a batch takes
+    MAIL_OUTBOX_LEASE_SECONDS = 300
+    MAIL_RATE_LIMIT = 10
+    MAIL_MAX_ATTEMPTS = 5
+    MAIL_RETRY_BACKOFF = 30
+    STUDENT_IMPORT_CHUNK_SIZE = 500
+    # student numbers a worker reserves at a time
+    STUDENT_ID_BLOCK_SIZE = 20
+    # number of proxies in front of the app whose X-Forwarded-For is trusted, 0 when clients connect directly
+    PROXY_FIX_X_FOR = config("PROXY_FIX_X_FOR", 0, cast=int)
+    # number of those proxies whose X-Forwarded-Proto is trusted, for the scheme of external urls
+    PROXY_FIX_X_PROTO = config("PROXY_FIX_X_PROTO", 0, cast=int)
+    # token buckets of the expensive routes as (requests, per seconds), kept in "memory" or the "database"
+    RATE_LIMIT_BACKEND = "memory"
+    # the "_ip" buckets hold all the accounts a client address tries before login
+    RATE_LIMITS = {
+        "login": (10, 60),
+        "login_ip": (50, 60),
+        "change_password": (5, 60),
+        "change_password_ip": (20, 60),
+        "gpa": (30, 60),
+        "score_sheet": (30, 60),
+    }
+    # audit events are written in batches by a background thread of every worker
+    AUDIT_BACKGROUND = True
+    AUDIT_QUEUE_SIZE = 10000
+    AUDIT_BATCH_SIZE = 200
+    AUDIT_FLUSH_SECONDS = 2
+    # where events that do not fit the queue go, a writable file shared by the workers. They are dropped if it is None
+    AUDIT_SPILL_FILE = config("AUDIT_SPILL_FILE", os.path.join(tempfile.gettempdir(), "student-api-audit-spill.jsonl"))
+    # set on every SQLite connection, WAL lets readers work alongside the writer of another worker
+    SQLITE_PRAGMAS = {"journal_mode": "WAL", "busy_timeout": 5000}
 
 
 class DevConfig(Config):
     DEBUG = config("DEBUG", cast=bool)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(BASE_DIR, "database.db")
+    SQLALCHEMY_ENGINE_OPTIONS = {"pool_size": 5, "max_overflow": 5, "pool_timeout": 30}
 
 
 class TestConfig(Config):
     TESTING = True
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"
+    PASSWORD_HASH_WORKERS = 0
+    MAIL_RATE_LIMIT = None
+    # events are written when the audit buffer is flushed
+    AUDIT_BACKGROUND = False
+    AUDIT_SPILL_FILE = None
     SQLALCHEMY_ECHO = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = "sqlite://"
 
 
 class ProductionConfig(Config):
+    # the Heroku router
+    PROXY_FIX_X_FOR = config("PROXY_FIX_X_FOR", 1, cast=int)
+    PROXY_FIX_X_PROTO = config("PROXY_FIX_X_PROTO", 1, cast=int)
+    # shared by the gunicorn workers
+    RATE_LIMIT_BACKEND = "database"
     SQLALCHEMY_DATABASE_URI = url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # every gunicorn worker opens up to pool_size + max_overflow connections, keep the total under the database limit
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": config("DB_POOL_SIZE", 5, cast=int),
+        "max_overflow": config("DB_MAX_OVERFLOW", 5, cast=int),
+        "pool_timeout": config("DB_POOL_TIMEOUT", 10, cast=int),
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    }
 
 
 config_dict = {"dev": DevConfig, "prod": ProductionConfig, "test": TestConfig}
@@ -1,30 +1,92 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
 from flask.views import MethodView
-from flask_smorest import Blueprint
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_smorest import Blueprint, abort
+from flask_jwt_extended import jwt_required
+from sqlalchemy import and_, delete, literal
+from sqlalchemy.exc import IntegrityError
 from models.courses import Course
-from models.user import User, EnrollmentStatus
+from models.cache import CacheVersion
+from models.grading import GradingScheme, GradeBoundary
+from models.user import User, EnrollmentStatus, student_course
+from models.principal import current_principal
 from models.scores import Score
+from models.enrollment import (
+    enroll,
+    insert_enrollments,
+    unenroll,
+    is_enrolled,
+    seat_enrollments,
+    leave_waitlist,
+    promote_from_waitlist,
+    waitlist_position,
+    WAITLISTED,
+)
+from models.waitlist import CourseWaitlist
+from models.audit import audit
 from utils import db
-from schemas import PlainCourseSchema, UserSchema, ScoreUploadSchema
-from flask import jsonify
-from utils import admin_required
+from schemas import PlainCourseSchema, UserSchema, UserFieldsArgsSchema, ScoreUploadSchema, CourseListArgsSchema, UserListArgsSchema, BatchScoreUploadSchema, IdListSchema, CourseStatisticsArgsSchema, GradingSchemeSchema, CourseGradingSchemeSchema, RegradeSchema, CourseCapacitySchema
+from flask import current_app, jsonify, request, Response
+from utils import admin_required, keyset_paginate, pagination_header, grade_to_point_converter, score_to_grade
 from http import HTTPStatus
 
 blp = Blueprint("courses", __name__, description='Operations on courses')
 
+CATALOG_CACHE_SIZE = 128
+catalog_cache_lock = threading.Lock()
+
+
+def catalog_cache():
+    """
+    Serialized catalog pages of this worker, valid while the shared catalog version is unchanged
+    """
+    return current_app.extensions.setdefault("course_catalog_cache", OrderedDict())
+
 
 @blp.route("/course")
 class CourseList(MethodView):
     @jwt_required()
     @admin_required()
+    @blp.arguments(CourseListArgsSchema, location="query")
     @blp.response(200, PlainCourseSchema(many=True))
-    @blp.doc(description="Get all courses. Can be accessed by only admins")
-    def get(self):
+    @blp.doc(description="Get courses a page at a time. Can be accessed by only admins."
+             " The cursor of the next page is returned in the X-Pagination header."
+             " Responses carry an ETag and If-None-Match is answered with 304 while the catalog is unchanged")
+    def get(self, args):
         """
         Get all courses
         """
-        courses = Course.query.all()
-        return courses, HTTPStatus.OK
+        version = CacheVersion.get("course_catalog")
+        key = json.dumps(args, sort_keys=True)
+        etag = f"{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=HTTPStatus.NOT_MODIFIED)
+            response.set_etag(etag)
+            return response
+
+        cache = catalog_cache()
+        with catalog_cache_lock:
+            cached = cache.get(key)
+            if cached is not None:
+                cache.move_to_end(key)
+        if cached is None or cached[0] != version:
+            query = Course.query
+            if "teacher" in args:
+                query = query.filter(Course.teacher == args["teacher"])
+            courses, next_cursor = keyset_paginate(query, (Course.id,), args["limit"], cursor=args.get("cursor"))
+            cached = (version, json.dumps(PlainCourseSchema(many=True).dump(courses)), next_cursor)
+            with catalog_cache_lock:
+                cache[key] = cached
+                cache.move_to_end(key)
+                if len(cache) > CATALOG_CACHE_SIZE:
+                    cache.popitem(last=False)
+
+        _, body, next_cursor = cached
+        response = Response(body, mimetype="application/json", headers=pagination_header(next_cursor, args["limit"]))
+        response.set_etag(etag)
+        return response
     
 
     @jwt_required()
@@ -39,7 +101,8 @@ class CourseList(MethodView):
         # checks if course with that name exists
         if course:
             return {"Error": "Course with that name exists"}, HTTPStatus.BAD_REQUEST
-        new_course = Course(name=course_data["name"], teacher=course_data["teacher"], unit=course_data['unit'])
+        new_course = Course(name=course_data["name"], teacher=course_data["teacher"], unit=course_data['unit'],
+                            capacity=course_data.get('capacity'))
         new_course.save()
         return {"Name": new_course.name, "Teacher": new_course.teacher, "Unit": new_course.unit}, HTTPStatus.CREATED
 
@@ -62,37 +125,158 @@ class CoursebyId(MethodView):
         return course, HTTPStatus.OK
 
 
+@blp.route("/course/<int:course_id>/stats")
+class CourseStatistics(MethodView):
+    @jwt_required()
+    @admin_required()
+    @blp.arguments(CourseStatisticsArgsSchema, location="query")
+    @blp.doc(description="Get the score count, mean, median, standard deviation, range, pass rate,"
+             " grade histogram and top scores of a course. Can be accessed by only admins",
+             params={
+                "course_id": "The course id"
+             }
+             )
+    def get(self, args, course_id):
+        """
+        Get course score statistics
+        """
+        course = Course.get_by_id(course_id)
+        stats = Score.course_statistics([course.id], top=args["top"])
+        return stats[course.id], HTTPStatus.OK
+
+
+@blp.route("/course/stats")
+class CohortStatistics(MethodView):
+    @jwt_required()
+    @admin_required()
+    @blp.arguments(CourseStatisticsArgsSchema, location="query")
+    @blp.doc(description="Get the score statistics of every course. Can be accessed by only admins")
+    def get(self, args):
+        """
+        Get score statistics of all courses
+        """
+        stats = Score.course_statistics(top=args["top"])
+        return jsonify(list(stats.values())), HTTPStatus.OK
+
+
 @blp.route("/course/<int:course_id>/enroll/<int:student_id>")
 class CourseEnroll(MethodView):
     @jwt_required()
     @admin_required()
-    @blp.response(200, UserSchema)
-    @blp.doc(description='Enroll a student in a course. Can be accessed by only admins',
+    @blp.arguments(UserFieldsArgsSchema, location="query")
+    @blp.alt_response(200, schema=UserSchema, success=True)
+    @blp.doc(description='Enroll a student in a course. When the course is full the student is added to its waitlist'
+             ' instead. Returns the student with the fields picked like in GET /student/<id>. Can be accessed by only admins',
              params={
                 "course_id": "The id of the course to enroll for",
                 "student_id": "The id of the student to enroll"
              }
              )
-    def put(self, course_id, student_id):
+    def put(self, args, course_id, student_id):
         """
         Enrolling for a course
         """
         course = Course.get_by_id(course_id)
-        student = User.get_by_id(student_id)
+        student = User.get_by_id(student_id, *User.field_options(args.get("only_fields"), args["include"], User.enrollment_status))
         #checks if student has been expelled
         if student.enrollment_status == EnrollmentStatus.EXPELLED:
             return {"message": "Student has been expelled. Cannot register for any course"}, HTTPStatus.BAD_REQUEST
-        student.courses.append(course)
+        # enrolls the student unless already enrolled for the course
+        if enroll(student.id, course.id) == WAITLISTED:
+            db.session.commit()
+            audit("waitlist", "student", student.id, course_id=course.id)
+            return jsonify(
+                message="Course is full. Student added to the waitlist",
+                position=waitlist_position(student.id, course.id),
+            ), HTTPStatus.ACCEPTED
+
+        db.session.commit()
+        audit("enroll", "student", student.id, course_id=course.id)
+        return jsonify(UserSchema.for_args(args).dump(student)), HTTPStatus.OK
+
+
+@blp.route("/course/<int:course_id>/enroll")
+class CourseBulkEnroll(MethodView):
+    @jwt_required()
+    @admin_required()
+    @blp.arguments(IdListSchema)
+    @blp.doc(description='Enroll many students in a course with one statement. Expelled students, admins'
+              ' and students already enrolled are skipped. Students beyond the capacity of the course'
+              ' are added to its waitlist in the order given. Can be accessed by only admins',
+             params={
+                "course_id": "The id of the course to enroll for"
+             }
+             )
+    def put(self, data, course_id):
+        """
+        Enroll many students in a course
+        """
+        course = Course.get_by_id(course_id)
+        students = db.select(User.id, literal(course.id)).where(
+            User.id.in_(data["ids"]),
+            User.is_admin != True,
+            User.enrollment_status != EnrollmentStatus.EXPELLED,
+        )
+        inserted = set(insert_enrollments(students, student_course.c.user_id))
+        seated, waitlisted = seat_enrollments([id for id in dict.fromkeys(data["ids"]) if id in inserted], course.id)
+        db.session.commit()
+        for id in seated:
+            audit("enroll", "student", id, course_id=course.id)
+        for id in waitlisted:
+            audit("waitlist", "student", id, course_id=course.id)
+        return {
+            "enrolled": seated,
+            "waitlisted": waitlisted,
+            "skipped": [id for id in dict.fromkeys(data["ids"]) if id not in inserted],
+        }, HTTPStatus.OK
+
 
+@blp.route("/student/<int:student_id>/enroll")
+class StudentBulkEnroll(MethodView):
+    @jwt_required()
+    @admin_required()
+    @blp.arguments(IdListSchema)
+    @blp.doc(description='Enroll a student in many courses with one statement. Courses the student'
+              ' is already enrolled in are skipped and full courses put the student on their waitlist.'
+              ' Can be accessed by only admins',
+             params={
+                "student_id": "The id of the student to enroll"
+             }
+             )
+    def put(self, data, student_id):
+        """
+        Enroll a student in many courses
+        """
+        student = User.get_by_id(student_id)
+        #checks if student has been expelled
+        if student.enrollment_status == EnrollmentStatus.EXPELLED:
+            return {"message": "Student has been expelled. Cannot register for any course"}, HTTPStatus.BAD_REQUEST
+        courses = db.select(literal(student.id), Course.id).where(Course.id.in_(data["ids"]))
+        enrolled = insert_enrollments(courses, student_course.c.course_id)
+        seated = []
+        waitlisted = []
+        for course_id in sorted(enrolled):
+            course_seated, _ = seat_enrollments([student.id], course_id)
+            (seated if course_seated else waitlisted).append(course_id)
         db.session.commit()
-        return student, HTTPStatus.OK
+        for course_id in seated:
+            audit("enroll", "student", student.id, course_id=course_id)
+        for course_id in waitlisted:
+            audit("waitlist", "student", student.id, course_id=course_id)
+        enrolled = set(enrolled)
+        return {
+            "enrolled": seated,
+            "waitlisted": waitlisted,
+            "skipped": [id for id in dict.fromkeys(data["ids"]) if id not in enrolled],
+        }, HTTPStatus.OK
     
 
 @blp.route("/course/<int:course_id>/unenroll/<int:student_id>")
 class CourseUnEnroll(MethodView):
     @jwt_required()
     @admin_required()
-    @blp.doc(description='Unenroll a student in a course. Can be accessed by only admins',
+    @blp.doc(description='Unenroll a student in a course or remove them from its waitlist. The freed seat goes'
+             ' to the next student on the waitlist. Can be accessed by only admins',
              params={
                 "course_id": "The id of the course to unenroll for",
                 "student_id": "The id of the student to unenroll"
@@ -104,16 +288,25 @@ class CourseUnEnroll(MethodView):
         """
         course = Course.get_by_id(course_id)
         student = User.get_by_id(student_id)
-        # checks if student has course registered
-        if course in student.courses:
-            student.courses.remove(course)
-            # checks if the course has a score recorded
-            score = Score.query.filter_by(user_id=student_id , course_id=course_id).first()
-            if score:
-                # deletes the score
-                db.session.delete(score)
+        # removes the enrollment if the student has course registered
+        promoted = unenroll(student.id, course.id)
+        if promoted is not None:
+            # deletes the score if the course has a score recorded
+            grade = db.session.execute(
+                delete(Score).where(Score.user_id == student.id, Score.course_id == course.id).returning(Score.grade)
+            ).scalar()
+            if grade is not None:
+                User.add_grade_points(student.id, -course.unit, -course.unit * grade_to_point_converter(grade))
             db.session.commit()
+            audit("unenroll", "student", student.id, course_id=course.id)
+            for user_id in promoted:
+                audit("promote", "student", user_id, course_id=course.id)
             return {"Message": "Unenrolled student from course"}, HTTPStatus.OK
+        # checks if student is on the waitlist of the course
+        if leave_waitlist([student.id], course.id):
+            db.session.commit()
+            audit("leave_waitlist", "student", student.id, course_id=course.id)
+            return {"Message": "Removed student from the course waitlist"}, HTTPStatus.OK
         return {"Error": "Student is not enrolled in this course"}, HTTPStatus.BAD_REQUEST
 
 
@@ -132,14 +325,13 @@ class StudentCourseList(MethodView):
         Get all courses a student offers
         """
         course_list = []
-        identity = get_jwt_identity()
-        user = User.get_by_id(identity)
+        user = current_principal()
         student = User.query.filter_by(student_id=student_id).first()
         
         # checks if student exists
         if student:
             # checks if the user accessing the route is an admin or the student whose course list is needed.
-            if (user.is_admin == True) or (identity == student.id):
+            if user.is_admin or (user.id == student.id):
                 for course in student.courses:
                     course_list.append(course.name)
                 return jsonify(course_list), HTTPStatus.OK
@@ -151,21 +343,34 @@ class StudentCourseList(MethodView):
 class CourseStudentsList(MethodView):
     @jwt_required()
     @admin_required()
-    @blp.doc(description='Get the student id of all students that offers a course.'
-              'This route can be accessed by only an admin.',
+    @blp.arguments(UserListArgsSchema, location="query")
+    @blp.doc(description='Get the student id of students that offers a course, a page at a time.'
+              'This route can be accessed by only an admin.'
+              'The cursor of the next page is returned in the X-Pagination header.',
              params={
                 "course_id": "The id of the course"
              }
              )
-    def get(self, course_id):
+    def get(self, args, course_id):
         """
         Get all students that take a course
         """
-        student_id_list = []
         course = Course.get_by_id(course_id)
-        for student in course.users:
-            student_id_list.append(student.student_id)
-        return jsonify(student_id_list), HTTPStatus.OK
+        columns = User.sort_columns(args["sort"])
+        query = db.session.query(*columns, User.student_id).join(
+            student_course, student_course.c.user_id == User.id
+        ).filter(student_course.c.course_id == course.id)
+        if "enrollment_status" in args:
+            query = query.filter(User.enrollment_status == args["enrollment_status"])
+        rows, next_cursor = keyset_paginate(
+            query,
+            columns,
+            args["limit"],
+            cursor=args.get("cursor"),
+            descending=args["order"] == "desc",
+        )
+        student_id_list = [row.student_id for row in rows]
+        return jsonify(student_id_list), HTTPStatus.OK, pagination_header(next_cursor, args["limit"])
         
 
 @blp.route("/course/<int:course_id>/score-upload")
@@ -187,35 +392,22 @@ class ScoreUpload(MethodView):
         student = User.query.filter_by(student_id=result_data['student_id']).first()
         # checks if student exists
         if student:
-            score=result_data['score']
-
-            # check for grades of score
-            if score >= 70:
-                grade = 'A'
-            elif (score < 70 and score >= 60):
-                grade = 'B'
-            elif (score < 60 and score >=50):
-                grade = 'C'
-            elif (score < 50 and score >= 45):
-                grade = 'D'
-            elif (score < 45 and score >= 40):
-                grade = 'E'
-            else:
-                grade = 'F'
+            grade = score_to_grade(result_data['score'], GradingScheme.boundaries_for(course))
 
             # checks if student is registered for the course
-            if course in student.courses:
-                existing_score = Score.query.filter_by(user_id=student.id, course_id=course_id).first()
-                # checks if score exists and updates
-                if existing_score:
-                    existing_score.score = result_data['score']
-                    existing_score.grade = grade
-                    db.session.commit()
-                    return {"message": "Result updated"}, HTTPStatus.ACCEPTED
-                # creates score if it does not exist
-                new_score = Score(score=result_data['score'], course_id=course_id, user_id=student.id, grade=grade)
-                db.session.add(new_score)
+            if is_enrolled(student.id, course.id):
+                score_exists = db.session.query(
+                    Score.query.filter_by(user_id=student.id, course_id=course_id).exists()
+                ).scalar()
+                # creates the score or updates it in one statement, so concurrent uploads cannot duplicate it
+                Score.upsert([{"score": result_data['score'], "grade": grade, "user_id": student.id, "course_id": course_id}])
+                # recomputed rather than adjusted so a concurrent upload of the same score cannot skew it
+                Score.refresh_gpa([student.id])
                 db.session.commit()
+                audit("grade", "student", student.id, course_id=course.id, score=result_data['score'], grade=grade)
+                # checks if score existed and was updated
+                if score_exists:
+                    return {"message": "Result updated"}, HTTPStatus.ACCEPTED
                 return {"message": "Result uploaded"}, HTTPStatus.CREATED
             return {"message": "Student isn't registered for this course"}, HTTPStatus.BAD_REQUEST
         return {"Error": "Student does not exist"}, HTTPStatus.NOT_FOUND
@@ -223,3 +415,271 @@ class ScoreUpload(MethodView):
 
         
             
+
+
+@blp.route("/course/<int:course_id>/score-upload/batch")
+class BatchScoreUpload(MethodView):
+    @blp.arguments(BatchScoreUploadSchema)
+    @jwt_required()
+    @admin_required()
+    @blp.doc(description='Upload the scores of many students in a particular course in one transaction.'
+              'Returns whether each row was created, updated or rejected.'
+              'This route can be accessed by only an admin.',
+             params={
+                "course_id": "The id of the course"
+             }
+             )
+    def put(self, result_data, course_id):
+        """
+        Upload course results in a batch
+        """
+        course = Course.get_by_id(course_id)
+        rows = result_data["scores"]
+        # resolves every student, their enrollment and existing score in one query
+        students = {
+            student.student_id: student
+            for student in db.session.query(
+                User.id,
+                User.student_id,
+                student_course.c.course_id.label("enrolled_course_id"),
+                Score.id.label("score_id"),
+            )
+            .outerjoin(student_course, and_(student_course.c.user_id == User.id, student_course.c.course_id == course.id))
+            .outerjoin(Score, and_(Score.user_id == User.id, Score.course_id == course.id))
+            .filter(User.student_id.in_({row["student_id"] for row in rows}))
+        }
+
+        boundaries = GradingScheme.boundaries_for(course)
+        results = []
+        scores = []
+        created = 0
+        seen = set()
+        for row in rows:
+            student = students.get(row["student_id"])
+            result = {"student_id": row["student_id"]}
+            if student is None:
+                result.update(result="rejected", message="Student does not exist")
+            elif student.enrolled_course_id is None:
+                result.update(result="rejected", message="Student isn't registered for this course")
+            elif student.id in seen:
+                result.update(result="rejected", message="Duplicate score for student")
+            else:
+                seen.add(student.id)
+                grade = score_to_grade(row["score"], boundaries)
+                scores.append({"score": row["score"], "grade": grade, "user_id": student.id, "course_id": course.id})
+                if student.score_id is None:
+                    created += 1
+                    result.update(result="created", grade=grade)
+                else:
+                    result.update(result="updated", grade=grade)
+            results.append(result)
+
+        if scores:
+            Score.upsert(scores)
+            Score.refresh_gpa(seen)
+        db.session.commit()
+        for score in scores:
+            audit("grade", "student", score["user_id"], course_id=course.id, score=score["score"], grade=score["grade"])
+        return {
+            "created": created,
+            "updated": len(scores) - created,
+            "rejected": len(results) - len(scores),
+            "results": results,
+        }, HTTPStatus.OK
+
+
+def replace_default_scheme(scheme):
+    """
+    Makes a scheme the only default grading scheme
+    """
+    if scheme.is_default:
+        GradingScheme.query.filter(GradingScheme.id != scheme.id).update({"is_default": False})
+
+
+@blp.route("/grading-scheme")
+class GradingSchemeList(MethodView):
+    @jwt_required()
+    @admin_required()
+    @blp.response(200, GradingSchemeSchema(many=True))
+    @blp.doc(description="Get all grading schemes. Can be accessed by only admins")
+    def get(self):
+        """
+        Get all grading schemes
+        """
+        return GradingScheme.query.order_by(GradingScheme.id).all(), HTTPStatus.OK
+
+    @jwt_required()
+    @admin_required()
+    @blp.arguments(GradingSchemeSchema)
+    @blp.response(201, GradingSchemeSchema)
+    @blp.doc(description="Create a grading scheme from the lowest score of each grade."
+             " The default scheme grades every course without a scheme of its own. Can be accessed by only admins")
+    def post(self, scheme_data):
+        """
+        Create a grading scheme
+        """
+        if GradingScheme.query.filter_by(name=scheme_data["name"]).first():
+            return {"Error": "Grading scheme with that name exists"}, HTTPStatus.BAD_REQUEST
+        scheme = GradingScheme(
+            name=scheme_data["name"],
+            is_default=scheme_data["is_default"],
+            boundaries=[GradeBoundary(**boundary) for boundary in scheme_data["boundaries"]],
+        )
+        db.session.add(scheme)
+        try:
+            db.session.flush()
+            replace_default_scheme(scheme)
+            db.session.commit()
+        except IntegrityError:
+            # a scheme with the name was created meanwhile
+            db.session.rollback()
+            abort(HTTPStatus.CONFLICT, message="Grading scheme with that name exists")
+        return scheme, HTTPStatus.CREATED
+
+
+@blp.route("/grading-scheme/<int:scheme_id>")
+class GradingSchemeById(MethodView):
+    @jwt_required()
+    @admin_required()
+    @blp.arguments(GradingSchemeSchema)
+    @blp.response(200, GradingSchemeSchema)
+    @blp.doc(description="Replace the boundaries of a grading scheme. Stored grades change only when regraded."
+             " Can be accessed by only admins",
+             params={
+                "scheme_id": "The id of the grading scheme"
+             }
+             )
+    def put(self, scheme_data, scheme_id):
+        """
+        Update a grading scheme
+        """
+        scheme = GradingScheme.get_by_id(scheme_id)
+        try:
+            scheme.name = scheme_data["name"]
+            scheme.is_default = scheme_data["is_default"]
+            scheme.boundaries = []
+            db.session.flush()
+            scheme.boundaries = [GradeBoundary(**boundary) for boundary in scheme_data["boundaries"]]
+            replace_default_scheme(scheme)
+            db.session.commit()
+        except IntegrityError:
+            # another scheme has the name
+            db.session.rollback()
+            abort(HTTPStatus.CONFLICT, message="Grading scheme with that name exists")
+        return scheme, HTTPStatus.OK
+
+
+@blp.route("/course/<int:course_id>/grading-scheme")
+class CourseGradingScheme(MethodView):
+    @jwt_required()
+    @admin_required()
+    @blp.arguments(CourseGradingSchemeSchema)
+    @blp.doc(description="Assign a grading scheme to a course, or null to use the default scheme."
+             " Can be accessed by only admins",
+             params={
+                "course_id": "The course id"
+             }
+             )
+    def put(self, data, course_id):
+        """
+        Assign a grading scheme to a course
+        """
+        course = Course.get_by_id(course_id)
+        if data["grading_scheme_id"] is not None:
+            GradingScheme.get_by_id(data["grading_scheme_id"])
+        course.grading_scheme_id = data["grading_scheme_id"]
+        db.session.commit()
+        return {"message": "Grading scheme assigned"}, HTTPStatus.OK
+
+
+@blp.route("/grading-scheme/regrade")
+class Regrade(MethodView):
+    @jwt_required()
+    @admin_required()
+    @blp.arguments(RegradeSchema)
+    @blp.doc(description="Regrade the scores of a course, or of every course when no course_id is given,"
+             " with their current grading schemes and refresh the affected gpas. Can be accessed by only admins")
+    def post(self, data):
+        """
+        Regrade scores
+        """
+        schemes = GradingScheme.boundaries_by_scheme()
+        courses = db.session.query(Course.id, Course.grading_scheme_id)
+        if "course_id" in data:
+            courses = courses.filter(Course.id == Course.get_by_id(data["course_id"]).id)
+        courses_by_scheme = {}
+        for course in courses:
+            scheme_id = course.grading_scheme_id if course.grading_scheme_id in schemes else None
+            courses_by_scheme.setdefault(scheme_id, []).append(course.id)
+
+        # one UPDATE ... CASE per grading scheme in use, touching only the grades that change
+        regraded = []
+        for scheme_id, course_ids in courses_by_scheme.items():
+            grade = GradingScheme.grade_expression(Score.score, schemes[scheme_id])
+            regraded += db.session.execute(
+                db.update(Score)
+                .where(Score.course_id.in_(course_ids), Score.grade.is_distinct_from(grade))
+                .values(grade=grade)
+                .returning(Score.user_id, Score.course_id, Score.grade),
+                execution_options={"synchronize_session": False},
+            ).all()
+        if "course_id" in data:
+            Score.refresh_gpa(db.select(Score.user_id).where(Score.course_id == data["course_id"]))
+        else:
+            Score.refresh_gpa()
+        db.session.commit()
+        for score in regraded:
+            audit("regrade", "student", score.user_id, course_id=score.course_id, grade=score.grade)
+        return {"message": f"Regraded {len(regraded)} scores"}, HTTPStatus.OK
+
+
+@blp.route("/course/<int:course_id>/capacity")
+class CourseCapacity(MethodView):
+    @jwt_required()
+    @admin_required()
+    @blp.arguments(CourseCapacitySchema)
+    @blp.doc(description="Change the capacity of a course, or null for unlimited seats. New seats are"
+             " filled from the waitlist. Can be accessed by only admins",
+             params={
+                "course_id": "The course id"
+             }
+             )
+    def put(self, data, course_id):
+        """
+        Change the capacity of a course
+        """
+        course = Course.get_by_id(course_id)
+        course.capacity = data["capacity"]
+        db.session.flush()
+        promoted = promote_from_waitlist(course.id)
+        db.session.commit()
+        for id in promoted:
+            audit("promote", "student", id, course_id=course.id)
+        return {"message": "Capacity updated", "promoted": promoted}, HTTPStatus.OK
+
+
+@blp.route("/course/<int:course_id>/waitlist")
+class CourseWaitlistView(MethodView):
+    @jwt_required()
+    @admin_required()
+    @blp.doc(description="Get the seats and the ordered waitlist of a course. Can be accessed by only admins",
+             params={
+                "course_id": "The course id"
+             }
+             )
+    def get(self, course_id):
+        """
+        Get the waitlist of a course
+        """
+        course = Course.get_by_id(course_id)
+        waitlist = db.session.query(User.student_id).join(
+            CourseWaitlist, CourseWaitlist.user_id == User.id
+        ).filter(CourseWaitlist.course_id == course.id).order_by(CourseWaitlist.id)
+        return {
+            "capacity": course.capacity,
+            "enrolled_count": course.enrolled_count,
+            "waitlist": [
+                {"student_id": row.student_id, "position": position}
+                for position, row in enumerate(waitlist, start=1)
+            ],
+        }, HTTPStatus.OK
@@ -0,0 +1,186 @@
+import atexit
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+from flask import current_app
+from flask_jwt_extended import get_jwt_identity
+from utils import db
+
+
+class AuditLog(db.Model):
+    """
+    Admin actions on students, courses and admins. The actor and target are plain ids
+    so that the log outlives deleted users.
+    """
+    __tablename__ = 'audit_log'
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    actor_id = db.Column(db.Integer)
+    action = db.Column(db.String(30), nullable=False)
+    target_type = db.Column(db.String(20), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    details = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_audit_log_actor_id_id', 'actor_id', 'id'),
+        db.Index('ix_audit_log_action_id', 'action', 'id'),
+        db.Index('ix_audit_log_target_type_target_id_id', 'target_type', 'target_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<AuditLog {self.action} {self.target_type} {self.target_id}>'
+
+
+class AuditBuffer:
+    """
+    Buffers audit events in a bounded queue and writes them in batched inserts, from a background
+    thread when started. Events that do not fit the queue, or could not be written, are spilled to
+    a json lines file that is written back once the database keeps up, or dropped without one.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config["AUDIT_BATCH_SIZE"]
+        self.flush_seconds = app.config["AUDIT_FLUSH_SECONDS"]
+        self.spill_file = app.config["AUDIT_SPILL_FILE"]
+        self.events = queue.Queue(maxsize=app.config["AUDIT_QUEUE_SIZE"])
+        self.dropped = 0
+        self.flush_lock = threading.Lock()
+        self.spill_lock = threading.Lock()
+        self.stop = threading.Event()
+        self.batch_ready = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="audit-flusher", daemon=True)
+        self.thread.start()
+        atexit.register(self.shutdown)
+
+    def record(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.spill([event])
+        if self.events.qsize() >= self.batch_size:
+            self.batch_ready.set()
+
+    def spill(self, events):
+        with self.spill_lock:
+            if not self.spill_file:
+                self.dropped += len(events)
+                return
+            # line buffered, so the lines of workers sharing the file are appended whole
+            with open(self.spill_file, "a", buffering=1) as file:
+                for event in events:
+                    file.write(json.dumps({**event, "created_at": event["created_at"].isoformat()}) + "\n")
+
+    def take_batch(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def write(self, batch):
+        try:
+            db.session.execute(db.insert(AuditLog), batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception("Writing %s audit events failed", len(batch))
+            self.spill(batch)
+            return False
+        return True
+
+    def read_spill(self, path):
+        events = []
+        with open(path) as file:
+            for number, line in enumerate(file, start=1):
+                try:
+                    event = json.loads(line)
+                    event["created_at"] = datetime.fromisoformat(event["created_at"])
+                except (ValueError, KeyError, TypeError):
+                    # a line cut short by a crash
+                    if line.strip():
+                        self.app.logger.warning("Skipping bad audit spill line %s of %s", number, path)
+                    continue
+                events.append(event)
+        return events
+
+    def replay_spill(self):
+        """
+        Writes back the events spilled to the file. The file is first moved to a name of this process,
+        so workers sharing it never replay or overwrite each other's events
+        """
+        if not self.spill_file:
+            return
+        replaying = f"{self.spill_file}.{os.getpid()}.replaying"
+        # a file left by a replay of this process that failed is replayed first
+        if not os.path.exists(replaying):
+            try:
+                with self.spill_lock:
+                    os.replace(self.spill_file, replaying)
+            except FileNotFoundError:
+                return
+        events = self.read_spill(replaying)
+        for start in range(0, len(events), self.batch_size):
+            # events that fail again are spilled back to the shared file
+            self.write(events[start:start + self.batch_size])
+        os.remove(replaying)
+
+    def flush(self):
+        """
+        Writes every buffered event. Must run in an app context
+        """
+        with self.flush_lock:
+            while batch := self.take_batch():
+                if not self.write(batch):
+                    return
+            self.replay_spill()
+
+    def run(self):
+        while not self.stop.is_set():
+            self.batch_ready.wait(self.flush_seconds)
+            self.batch_ready.clear()
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                # the flusher keeps running, the events stay queued or spilled until the next flush
+                self.app.logger.exception("Flushing the audit log failed")
+
+    def shutdown(self):
+        self.stop.set()
+        self.batch_ready.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.flush_seconds + 5)
+        with self.app.app_context():
+            self.flush()
+
+
+def audit_buffer():
+    buffer = current_app.extensions.get("audit_buffer")
+    if buffer is None:
+        buffer = AuditBuffer(current_app._get_current_object())
+        current_app.extensions["audit_buffer"] = buffer
+        if current_app.config["AUDIT_BACKGROUND"]:
+            buffer.start()
+    return buffer
+
+
+def audit(action, target_type, target_id, **details):
+    """
+    Records an admin action by the caller. Call it once the action is committed
+    """
+    audit_buffer().record({
+        "actor_id": get_jwt_identity(),
+        "action": action,
+        "target_type": target_type,
+        "target_id": target_id,
+        "details": details or None,
+        "created_at": datetime.utcnow(),
+    })
@@ -1,7 +1,112 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from flask import current_app
 from utils import db
 
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class RevocationCache:
+    """
+    Revoked jtis of this worker, refreshed incrementally from the created_at of new
+    blocklist rows so that checking a token that is not revoked needs no query.
+    Expired blocklist rows are pruned every prune_seconds by a refresh.
+    """
+
+    # rows committed slightly out of created_at order are picked up by re-reading this window
+    OVERLAP = timedelta(seconds=60)
+
+    def __init__(self, refresh_seconds, max_age, prune_seconds):
+        self.refresh_seconds = refresh_seconds
+        self.max_age = max_age
+        self.prune_seconds = prune_seconds
+        self.pruned_at = None
+        self.revoked = {}
+        self.last_seen = None
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+
+    def __contains__(self, jti):
+        return jti in self.revoked
+
+    def add(self, jti, created_at):
+        self.revoked[jti] = created_at
+
+    def refresh(self):
+        with self.lock:
+            if self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.refresh_seconds:
+                return
+            prune = self.pruned_at is None or time.monotonic() - self.pruned_at >= self.prune_seconds
+            if prune:
+                self.pruned_at = time.monotonic()
+            now = utcnow()
+            # tokens revoked before the longest token lifetime have expired anyway
+            since = now - self.max_age
+            if self.last_seen is not None:
+                since = max(since, self.last_seen - self.OVERLAP)
+            rows = db.session.execute(
+                db.select(TokenBlocklist.jti, TokenBlocklist.created_at).where(TokenBlocklist.created_at > since)
+            )
+            for jti, created_at in rows:
+                self.revoked[jti] = created_at
+                if self.last_seen is None or created_at > self.last_seen:
+                    self.last_seen = created_at
+            self.last_seen = self.last_seen or since
+            self.revoked = {
+                jti: created_at for jti, created_at in self.revoked.items() if created_at > now - self.max_age
+            }
+            self.refreshed_at = time.monotonic()
+        if prune:
+            TokenBlocklist.prune()
+
+
 class TokenBlocklist(db.Model):
     __tablename__ = 'blocklist'
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), nullable=False, index=True)
-    created_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, index=True)
+
+    @staticmethod
+    def max_token_age():
+        return max(current_app.config["JWT_ACCESS_TOKEN_EXPIRES"], current_app.config["JWT_REFRESH_TOKEN_EXPIRES"])
+
+    @classmethod
+    def revocation_cache(cls):
+        cache = current_app.extensions.get("token_revocations")
+        if cache is None:
+            cache = RevocationCache(
+                current_app.config["JWT_REVOCATION_REFRESH_SECONDS"],
+                cls.max_token_age(),
+                current_app.config["JWT_BLOCKLIST_PRUNE_SECONDS"],
+            )
+            current_app.extensions["token_revocations"] = cache
+        return cache
+
+    @classmethod
+    def revoke(cls, jti):
+        """
+        Blocklists a token and revokes it in this worker straight away
+        """
+        token = cls(jti=jti, created_at=utcnow())
+        db.session.add(token)
+        db.session.commit()
+        cls.revocation_cache().add(token.jti, token.created_at)
+
+    @classmethod
+    def is_revoked(cls, jti):
+        cache = cls.revocation_cache()
+        cache.refresh()
+        return jti in cache
+
+    @classmethod
+    def prune(cls):
+        """
+        Deletes the entries of tokens that have expired on a connection of its own, so it can run
+        while a request is checking its token. Returns the number deleted
+        """
+        with db.engine.begin() as connection:
+            result = connection.execute(db.delete(cls).where(cls.created_at < utcnow() - cls.max_token_age()))
+        return result.rowcount
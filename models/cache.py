@@ -0,0 +1,45 @@
+from utils import db
+from sqlalchemy import event
+from utils.db import dialect_insert
+
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name} {self.version}>'
+
+    @classmethod
+    def get(cls, name):
+        """
+        Returns the current version of a cache shared by all workers
+        """
+        return db.session.scalar(db.select(cls.version).where(cls.name == name)) or 0
+
+    @classmethod
+    def bump(cls, name, connection):
+        """
+        Increments the version of a cache on the connection of the current transaction
+        """
+        table = cls.__table__
+        statement = dialect_insert(table, connection.dialect)
+        # the first writers of a name may race to create its row
+        connection.execute(
+            statement.values(name=name, version=1).on_conflict_do_update(
+                index_elements=[table.c.name], set_={"version": table.c.version + 1}
+            )
+        )
+
+    @classmethod
+    def bump_on_write(cls, model, name):
+        """
+        Bumps the version of a cache in the same transaction as any flush that writes model rows
+        """
+        @event.listens_for(db.session, "after_flush")
+        def bump_version(session, flush_context):
+            # objects only touched through a relationship collection are dirty without a column change
+            changed = (instance for instance in session.dirty if session.is_modified(instance, include_collections=False))
+            if any(isinstance(instance, model) for instance in (*session.new, *changed, *session.deleted)):
+                cls.bump(name, session.connection())
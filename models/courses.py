@@ -1,4 +1,5 @@
 from utils import db
+from models.cache import CacheVersion
 
 class Course(db.Model):
     __tablename__='course'
@@ -6,6 +7,11 @@ class Course(db.Model):
     name = db.Column(db.String(45), nullable=False, unique=True)
     teacher = db.Column(db.String(45), nullable=False)
     unit = db.Column(db.Integer, nullable=False)
+    grading_scheme_id = db.Column(db.Integer, db.ForeignKey('grading_scheme.id'))
+    # seats of the course, unlimited when null
+    capacity = db.Column(db.Integer)
+    # number of user_course rows of the course, kept in step by models.enrollment
+    enrolled_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     scores = db.relationship('Score', backref='course')
     
 
@@ -19,3 +25,6 @@ class Course(db.Model):
     @classmethod
     def get_by_id(cls, id):
         return cls.query.get_or_404(id)
+
+
+CacheVersion.bump_on_write(Course, 'course_catalog')
@@ -0,0 +1,195 @@
+from utils import db
+from utils.db import dialect_insert
+from models.user import User, EnrollmentStatus, student_course
+from models.courses import Course
+from models.waitlist import CourseWaitlist
+
+ENROLLED = 'enrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+WAITLISTED = 'waitlisted'
+
+
+def enrollment_filter(user_id, course_id):
+    return (student_course.c.user_id == user_id) & (student_course.c.course_id == course_id)
+
+
+def is_enrolled(user_id, course_id):
+    """
+    Checks if a student is enrolled in a course with an indexed EXISTS query
+    """
+    return db.session.scalar(db.select(db.select(student_course).where(enrollment_filter(user_id, course_id)).exists()))
+
+
+def take_seat(course_id):
+    """
+    Takes a seat of a course if one is free. The conditional UPDATE locks only the course row,
+    so concurrent enrollments cannot over-allocate it.
+    """
+    result = db.session.execute(
+        db.update(Course)
+        .where(
+            Course.id == course_id,
+            (Course.capacity == None) | (Course.enrolled_count < Course.capacity),
+        )
+        .values(enrolled_count=Course.enrolled_count + 1),
+        execution_options={"synchronize_session": False},
+    )
+    return result.rowcount > 0
+
+
+def release_seats(course_id, seats=1):
+    db.session.execute(
+        db.update(Course)
+        .where(Course.id == course_id)
+        .values(enrolled_count=Course.enrolled_count - seats),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def join_waitlist(user_ids, course_id):
+    """
+    Adds students to the end of the waitlist of a course, skipping those already on it even if
+    they were added by a concurrent transaction
+    """
+    if not user_ids:
+        return
+    statement = dialect_insert(CourseWaitlist, db.session.get_bind().dialect).on_conflict_do_nothing(
+        index_elements=[CourseWaitlist.user_id, CourseWaitlist.course_id]
+    )
+    db.session.execute(statement, [{"user_id": user_id, "course_id": course_id} for user_id in user_ids])
+
+
+def leave_waitlist(user_ids, course_id):
+    result = db.session.execute(
+        db.delete(CourseWaitlist).where(
+            CourseWaitlist.course_id == course_id, CourseWaitlist.user_id.in_(user_ids)
+        )
+    )
+    return result.rowcount > 0
+
+
+def waitlist_position(user_id, course_id):
+    entry = db.select(CourseWaitlist.id).where(
+        CourseWaitlist.user_id == user_id, CourseWaitlist.course_id == course_id
+    ).scalar_subquery()
+    return db.session.scalar(
+        db.select(db.func.count(CourseWaitlist.id)).where(
+            CourseWaitlist.course_id == course_id, CourseWaitlist.id <= entry
+        )
+    )
+
+
+def insert_enrollments(rows, returning):
+    """
+    Inserts the user_id, course_id rows of a select, skipping students already enrolled even if they
+    were enrolled by a concurrent transaction. Returns the returning column of the inserted rows
+    """
+    statement = (
+        dialect_insert(student_course, db.session.get_bind().dialect)
+        .from_select(["user_id", "course_id"], rows)
+        .on_conflict_do_nothing(index_elements=[student_course.c.user_id, student_course.c.course_id])
+        .returning(returning)
+    )
+    return db.session.execute(statement).scalars().all()
+
+
+def insert_enrollment(user_id, course_id):
+    # the WHERE keeps SQLite from parsing ON CONFLICT as a join constraint
+    rows = db.select(db.literal(user_id), db.literal(course_id)).where(db.true())
+    return bool(insert_enrollments(rows, student_course.c.user_id))
+
+
+def enroll(user_id, course_id):
+    """
+    Enrolls a student in a course if a seat is free and waitlists them otherwise.
+    Returns ENROLLED, ALREADY_ENROLLED or WAITLISTED
+    """
+    if not insert_enrollment(user_id, course_id):
+        return ALREADY_ENROLLED
+    if take_seat(course_id):
+        leave_waitlist([user_id], course_id)
+        return ENROLLED
+    db.session.execute(student_course.delete().where(enrollment_filter(user_id, course_id)))
+    join_waitlist([user_id], course_id)
+    return WAITLISTED
+
+
+def seat_enrollments(user_ids, course_id):
+    """
+    Gives seats to students just inserted into a course in order, moving the ones
+    that do not fit to the waitlist. Returns the seated and waitlisted ids
+    """
+    course = db.session.query(Course.capacity, Course.enrolled_count).filter(Course.id == course_id).with_for_update().one()
+    free = len(user_ids) if course.capacity is None else max(course.capacity - course.enrolled_count, 0)
+    seated, waitlisted = user_ids[:free], user_ids[free:]
+    db.session.execute(
+        db.update(Course)
+        .where(Course.id == course_id)
+        .values(enrolled_count=Course.enrolled_count + len(seated)),
+        execution_options={"synchronize_session": False},
+    )
+    if seated:
+        leave_waitlist(seated, course_id)
+    if waitlisted:
+        db.session.execute(
+            student_course.delete().where(
+                student_course.c.course_id == course_id, student_course.c.user_id.in_(waitlisted)
+            )
+        )
+        join_waitlist(waitlisted, course_id)
+    return seated, waitlisted
+
+
+def promote_from_waitlist(course_id):
+    """
+    Fills the free seats of a course from the head of its waitlist. Returns the promoted ids
+    """
+    promoted = []
+    while take_seat(course_id):
+        entry = db.session.execute(
+            db.select(CourseWaitlist.id, CourseWaitlist.user_id)
+            .join(User, User.id == CourseWaitlist.user_id)
+            .where(
+                CourseWaitlist.course_id == course_id,
+                User.enrollment_status != EnrollmentStatus.EXPELLED,
+            )
+            .order_by(CourseWaitlist.id)
+            .limit(1)
+            .with_for_update(of=CourseWaitlist, skip_locked=True)
+        ).first()
+        if entry is None:
+            release_seats(course_id)
+            break
+        db.session.execute(db.delete(CourseWaitlist).where(CourseWaitlist.id == entry.id))
+        if insert_enrollment(entry.user_id, course_id):
+            promoted.append(entry.user_id)
+        else:
+            release_seats(course_id)
+    return promoted
+
+
+def unenroll(user_id, course_id):
+    """
+    Removes a student from a course and gives the seat to the next student on the waitlist.
+    Returns the ids of the promoted students, or None if the student was not enrolled
+    """
+    statement = student_course.delete().where(enrollment_filter(user_id, course_id))
+    if db.session.execute(statement).rowcount == 0:
+        return None
+    release_seats(course_id)
+    return promote_from_waitlist(course_id)
+
+
+def unenroll_all(user_id):
+    """
+    Removes a student from every course and waitlist. Returns the ids of the promoted students by course
+    """
+    course_ids = db.session.execute(
+        student_course.delete().where(student_course.c.user_id == user_id).returning(student_course.c.course_id)
+    ).scalars().all()
+    db.session.execute(db.delete(CourseWaitlist).where(CourseWaitlist.user_id == user_id))
+    promoted = {}
+    for course_id in course_ids:
+        release_seats(course_id)
+        promoted[course_id] = promote_from_waitlist(course_id)
+    return promoted
@@ -0,0 +1,78 @@
+from flask import current_app
+from utils import db, DEFAULT_GRADE_BOUNDARIES
+from sqlalchemy import case
+from models.cache import CacheVersion
+
+
+class GradingScheme(db.Model):
+    __tablename__ = 'grading_scheme'
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    name = db.Column(db.String(45), nullable=False, unique=True)
+    is_default = db.Column(db.Boolean, nullable=False, default=False)
+    boundaries = db.relationship('GradeBoundary', backref='scheme', cascade='all, delete-orphan',
+                                 order_by='GradeBoundary.min_score.desc()')
+    courses = db.relationship('Course', backref='grading_scheme')
+
+    def __repr__(self):
+        return f'<GradingScheme {self.name}>'
+
+    def save(self):
+        db.session.add(self)
+        db.session.commit()
+
+    @classmethod
+    def get_by_id(cls, id):
+        return cls.query.get_or_404(id)
+
+    @classmethod
+    def boundaries_by_scheme(cls):
+        """
+        Returns the (min_score, grade) boundaries of every scheme keyed by scheme id, with the
+        default scheme under None. They are loaded once per worker and reloaded when a scheme changes.
+        """
+        version = CacheVersion.get('grading_schemes')
+        cached = current_app.extensions.get('grading_schemes')
+        if cached is None or cached[0] != version:
+            schemes = {None: DEFAULT_GRADE_BOUNDARIES}
+            rows = db.session.query(cls.id, cls.is_default, GradeBoundary.min_score, GradeBoundary.grade).join(
+                GradeBoundary, GradeBoundary.scheme_id == cls.id
+            ).order_by(cls.id, GradeBoundary.min_score.desc())
+            for row in rows:
+                schemes.setdefault(row.id, []).append((row.min_score, row.grade))
+                if row.is_default:
+                    schemes[None] = schemes[row.id]
+            cached = (version, schemes)
+            current_app.extensions['grading_schemes'] = cached
+        return cached[1]
+
+    @classmethod
+    def boundaries_for(cls, course):
+        """
+        Returns the grade boundaries of a course, falling back to the default scheme
+        """
+        schemes = cls.boundaries_by_scheme()
+        return schemes.get(course.grading_scheme_id, schemes[None])
+
+    @staticmethod
+    def grade_expression(score, boundaries):
+        """
+        Grades a score column in SQL with the same boundaries as utils.score_to_grade
+        """
+        return case(*[(score >= min_score, grade) for min_score, grade in boundaries], else_='F')
+
+
+class GradeBoundary(db.Model):
+    __tablename__ = 'grade_boundary'
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    scheme_id = db.Column(db.Integer, db.ForeignKey('grading_scheme.id'), nullable=False)
+    grade = db.Column(db.String(1), nullable=False)
+    min_score = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('scheme_id', 'grade'),)
+
+    def __repr__(self):
+        return f'<GradeBoundary {self.grade} {self.min_score}>'
+
+
+CacheVersion.bump_on_write(GradingScheme, 'grading_schemes')
+CacheVersion.bump_on_write(GradeBoundary, 'grading_schemes')
@@ -0,0 +1,148 @@
+import smtplib
+import time
+from datetime import datetime, timedelta
+from flask import current_app, url_for
+from flask_mail import Message
+from utils import db, mail
+
+PENDING = 'pending'
+FAILED = 'failed'
+
+
+class EmailOutbox(db.Model):
+    """
+    Emails waiting to be sent. Rows are written in the transaction of the change that
+    triggers them and delivered afterwards by the outbox sender. Sent emails are deleted
+    and failed ones lose their body, which may hold a default password.
+    """
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255), nullable=False)
+    # comma separated
+    recipients = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status}>'
+
+    @classmethod
+    def queue(cls, subject, recipients, body, sender="noreply@demo.com"):
+        """
+        Adds an email to the current transaction. It is sent only if the transaction commits
+        """
+        email = cls(subject=subject, sender=sender, recipients=",".join(recipients), body=body)
+        db.session.add(email)
+        return email
+
+    def message(self):
+        return Message(self.subject, sender=self.sender, recipients=self.recipients.split(","), body=self.body)
+
+    def failed(self, error):
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= current_app.config["MAIL_MAX_ATTEMPTS"]:
+            self.status = FAILED
+            self.body = ""
+            return
+        backoff = current_app.config["MAIL_RETRY_BACKOFF"] * 2 ** (self.attempts - 1)
+        self.next_attempt_at = datetime.utcnow() + timedelta(seconds=min(backoff, 3600))
+
+    @classmethod
+    def claim(cls):
+        """
+        Leases a batch of due emails for MAIL_OUTBOX_LEASE_SECONDS so that other senders skip them,
+        and commits so that no row stays locked while they are sent. Returns their ids and messages
+        """
+        batch = (
+            cls.query.filter(cls.status == PENDING, cls.next_attempt_at <= datetime.utcnow())
+            .order_by(cls.id)
+            .limit(current_app.config["MAIL_OUTBOX_BATCH_SIZE"])
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        lease = datetime.utcnow() + timedelta(seconds=current_app.config["MAIL_OUTBOX_LEASE_SECONDS"])
+        claimed = []
+        for email in batch:
+            email.next_attempt_at = lease
+            claimed.append((email.id, email.message()))
+        db.session.commit()
+        return claimed
+
+    @classmethod
+    def send_pending(cls):
+        """
+        Sends a batch of due emails over one SMTP connection, recording every email once it is
+        sent or failed. Returns the number sent
+        """
+        claimed = cls.claim()
+        if not claimed:
+            return 0
+        rate = current_app.config["MAIL_RATE_LIMIT"]
+        sent = 0
+        done = set()
+        try:
+            with mail.connect() as connection:
+                for id, message in claimed:
+                    started = time.monotonic()
+                    try:
+                        connection.send(message)
+                    except (smtplib.SMTPServerDisconnected, OSError):
+                        # the rest of the batch is retried on a new connection
+                        raise
+                    except smtplib.SMTPException as error:
+                        db.session.get(cls, id).failed(error)
+                    else:
+                        db.session.execute(db.delete(cls).where(cls.id == id))
+                        sent += 1
+                    db.session.commit()
+                    done.add(id)
+                    if rate:
+                        time.sleep(max(1 / rate - (time.monotonic() - started), 0))
+        except (smtplib.SMTPException, OSError) as error:
+            for id, _ in claimed:
+                if id not in done:
+                    db.session.get(cls, id).failed(error)
+            db.session.commit()
+        return sent
+
+
+def run_outbox_sender(app, stop):
+    while not stop.is_set():
+        sent = 0
+        with app.app_context():
+            try:
+                sent = EmailOutbox.send_pending()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Sending the email outbox failed")
+        # keeps draining while there is a backlog
+        if not sent:
+            stop.wait(app.config["MAIL_OUTBOX_POLL_SECONDS"])
+
+
+def student_reset_password_email(user, password):
+    EmailOutbox.queue(
+        "Student Management API Password Reset",
+        recipients=[user.email],
+        body=f"""You are now a student of AltSchool Africa. Congratulations!
+        Your default password is {password}. Please visit the following link to change it
+        {url_for('api-docs.openapi_swagger_ui', _external=True)}""",
+    )
+
+
+def admin_reset_password_email(user, password):
+    EmailOutbox.queue(
+        "Student Management API Password Reset",
+        recipients=[user.email],
+        body=f"""You have been an admin of the Student Management API of AltSchool Africa. Congratulations!
+        Your default password is {password}. Please visit the following link to change it
+        {url_for('api-docs.openapi_swagger_ui', _external=True)}""",
+    )
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import current_app, g, abort
+from flask_jwt_extended import get_jwt_identity
+from utils import db
+from models.user import User
+
+# what authorization needs to know about a user
+Principal = namedtuple('Principal', ['id', 'is_admin', 'enrollment_status', 'student_id'])
+
+
+class PrincipalCache:
+    """
+    Role flags of recently seen users and the id of the super admin, kept by every worker
+    for a few seconds. Changes made by this worker invalidate them straight away, the ttl
+    bounds how long the other workers can lag behind.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.principals = OrderedDict()
+        self.super_admin = None
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.principals.get(key) if key != 'super_admin' else self.super_admin
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def put(self, id, principal):
+        with self.lock:
+            self.principals[id] = (time.monotonic() + self.ttl, principal)
+            self.principals.move_to_end(id)
+            while len(self.principals) > self.max_size:
+                self.principals.popitem(last=False)
+
+    def put_super_admin(self, id):
+        with self.lock:
+            self.super_admin = (time.monotonic() + self.ttl, id)
+
+    def invalidate(self, ids):
+        with self.lock:
+            for id in ids:
+                self.principals.pop(id, None)
+            if self.super_admin is not None and self.super_admin[1] in ids:
+                self.super_admin = None
+
+
+def principal_cache():
+    cache = current_app.extensions.get('principals')
+    if cache is None:
+        cache = PrincipalCache(current_app.config['PRINCIPAL_CACHE_TTL'], current_app.config['PRINCIPAL_CACHE_SIZE'])
+        current_app.extensions['principals'] = cache
+    return cache
+
+
+def load_principal(id):
+    """
+    Returns the principal of a user, from the cache when it is fresh
+    """
+    cache = principal_cache()
+    principal = cache.get(id)
+    if principal is None:
+        row = db.session.execute(
+            db.select(User.id, User.is_admin, User.enrollment_status, User.student_id).where(User.id == id)
+        ).first()
+        if row is None:
+            return None
+        principal = Principal(row.id, bool(row.is_admin), row.enrollment_status, row.student_id)
+        cache.put(id, principal)
+    return principal
+
+
+def current_principal():
+    """
+    Returns the principal of the caller, loaded once per request
+    """
+    if 'principal' not in g:
+        principal = load_principal(get_jwt_identity())
+        if principal is None:
+            abort(404)
+        g.principal = principal
+    return g.principal
+
+
+def super_admin_id():
+    """
+    Returns the id of the user whose email is the SUPER_ADMIN_EMAIL, or None
+    """
+    cache = principal_cache()
+    id = cache.get('super_admin')
+    if id is None:
+        id = db.session.scalar(db.select(User.id).where(User.email == current_app.config['SUPER_ADMIN_EMAIL']))
+        # a missing super admin is not cached so that signing them up takes effect at once
+        if id is not None:
+            cache.put_super_admin(id)
+    return id
+
+
+def invalidate_principals(*ids):
+    """
+    Drops the cached principals of users whose role, status or existence changed
+    """
+    principal_cache().invalidate(set(ids))
+    if 'principal' in g and g.principal.id in ids:
+        g.pop('principal')
@@ -0,0 +1,74 @@
+import time
+from utils import db
+from utils.db import dialect_insert
+
+
+class RateLimitBucket(db.Model):
+    """
+    Token buckets shared by all workers
+    """
+    __tablename__ = 'rate_limit_bucket'
+    key = db.Column(db.String(255), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    # seconds since the epoch
+    updated_at = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<RateLimitBucket {self.key} {self.tokens}>'
+
+
+def database_seconds(dialect):
+    """
+    The seconds since the epoch by the database clock, so that workers with skewed clocks refill alike
+    """
+    if dialect == 'postgresql':
+        return db.cast(db.extract('epoch', db.func.now()), db.Float)
+    return (db.func.julianday('now') - 2440587.5) * 86400.0
+
+
+class DatabaseBucketBackend:
+    """
+    Keeps the token buckets in the rate_limit_bucket table so that limits hold across workers.
+    Each take is one conditional UPDATE committed on its own connection. Buckets idle for longer
+    than max_age are full again and are swept every sweep_seconds.
+    """
+
+    def __init__(self, max_age, sweep_seconds=300):
+        self.max_age = max_age
+        self.sweep_seconds = sweep_seconds
+        self.next_sweep = 0
+
+    def take(self, key, capacity, per):
+        self.sweep()
+        rate = capacity / per
+        table = RateLimitBucket.__table__
+        with db.engine.begin() as connection:
+            statement = dialect_insert(table, connection.dialect)
+            now = database_seconds(connection.dialect.name)
+            refilled = table.c.tokens + (now - table.c.updated_at) * rate
+            tokens = db.case((refilled > capacity, capacity), else_=refilled)
+            take = table.update().where(table.c.key == key, tokens >= 1).values(tokens=tokens - 1, updated_at=now)
+            if connection.execute(take).rowcount:
+                return 0
+            created = connection.execute(
+                statement.values(key=key, tokens=capacity - 1, updated_at=now).on_conflict_do_nothing(
+                    index_elements=[table.c.key]
+                )
+            )
+            # another worker may have created the bucket since the first UPDATE
+            if created.rowcount or connection.execute(take).rowcount:
+                return 0
+            left = connection.execute(db.select(tokens).where(table.c.key == key)).scalar_one()
+        return max((1 - left) / rate, 0.001)
+
+    def sweep(self):
+        """
+        Deletes the buckets idle for longer than max_age, at most every sweep_seconds. Returns the number deleted
+        """
+        if time.monotonic() < self.next_sweep:
+            return 0
+        self.next_sweep = time.monotonic() + self.sweep_seconds
+        table = RateLimitBucket.__table__
+        with db.engine.begin() as connection:
+            now = database_seconds(connection.dialect.name)
+            return connection.execute(table.delete().where(table.c.updated_at < now - self.max_age)).rowcount
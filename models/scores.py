@@ -1,4 +1,10 @@
-from utils import db
+import statistics
+from itertools import groupby
+from utils import db, GRADE_POINTS
+from utils.db import dialect_insert
+from sqlalchemy import and_, case, cast, extract, func
+from models.user import User, student_course
+from models.courses import Course
 
 class Score(db.Model):
     __tablename__='score'
@@ -7,6 +13,8 @@ class Score(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'))
     grade = db.Column(db.String(1), nullable=False)
+
+    __table_args__ = (db.Index('uq_score_user_id_course_id', 'user_id', 'course_id', unique=True),)
     
 
     def __repr__(self):
@@ -18,4 +26,215 @@ class Score(db.Model):
 
     @classmethod
     def get_by_id(cls, id):
-        return cls.query.get_or_404(id)
\ No newline at end of file
+        return cls.query.get_or_404(id)
+
+    @classmethod
+    def upsert(cls, rows):
+        """
+        Inserts scores or updates the score and grade of existing ones in one statement
+        """
+        statement = dialect_insert(cls, db.session.get_bind().dialect)
+        statement = statement.on_conflict_do_update(
+            index_elements=[cls.user_id, cls.course_id],
+            set_={"score": statement.excluded.score, "grade": statement.excluded.grade},
+        )
+        db.session.execute(statement, rows)
+
+    @classmethod
+    def score_sheet_query(cls):
+        """
+        Selects every course students are enrolled in with the score, if any,
+        in a single outer join of user_course, course and score.
+        Students without courses come back once with empty course columns.
+        """
+        return (
+            db.session.query(User.id, User.student_id, Course.name, Course.unit, cls.score, cls.grade)
+            .select_from(User)
+            .outerjoin(student_course, student_course.c.user_id == User.id)
+            .outerjoin(Course, Course.id == student_course.c.course_id)
+            .outerjoin(cls, and_(cls.user_id == User.id, cls.course_id == Course.id))
+            .order_by(User.id, Course.id)
+        )
+
+
+    @classmethod
+    def grade_points_expression(cls):
+        return case(GRADE_POINTS, value=cls.grade, else_=0)
+
+    @classmethod
+    def gpa_totals_query(cls):
+        """
+        Aggregates the gpa totals of every scored student from the live score table
+        """
+        return (
+            db.session.query(
+                cls.user_id,
+                func.sum(Course.unit).label("total_units"),
+                func.sum(Course.unit * cls.grade_points_expression()).label("total_grade_points"),
+            )
+            .join(Course, Course.id == cls.course_id)
+            .group_by(cls.user_id)
+        )
+
+    @classmethod
+    def refresh_gpa(cls, user_ids=None):
+        """
+        Recomputes the stored gpa totals with one UPDATE, for all users or the given ones
+        """
+        units = (
+            db.select(func.coalesce(func.sum(Course.unit), 0))
+            .select_from(cls)
+            .join(Course, Course.id == cls.course_id)
+            .where(cls.user_id == User.id)
+            .scalar_subquery()
+        )
+        grade_points = (
+            db.select(func.coalesce(func.sum(Course.unit * cls.grade_points_expression()), 0))
+            .select_from(cls)
+            .join(Course, Course.id == cls.course_id)
+            .where(cls.user_id == User.id)
+            .scalar_subquery()
+        )
+        statement = db.update(User).values(total_units=units, total_grade_points=grade_points)
+        if user_ids is not None:
+            statement = statement.where(User.id.in_(user_ids))
+        db.session.execute(statement, execution_options={"synchronize_session": False})
+
+    @classmethod
+    def gpa_mismatches(cls):
+        """
+        Returns the ids of users whose stored gpa totals differ from the score table
+        """
+        live = cls.gpa_totals_query().subquery()
+        return [
+            row.id
+            for row in db.session.query(User.id)
+            .outerjoin(live, live.c.user_id == User.id)
+            .filter(
+                (User.total_units != func.coalesce(live.c.total_units, 0))
+                | (User.total_grade_points != func.coalesce(live.c.total_grade_points, 0))
+            )
+        ]
+
+    @classmethod
+    def ranking_query(cls, course_id=None, admission_year=None):
+        """
+        Ranks students by unit weighted gpa with window functions over one aggregate.
+        Rows are ordered by position, the unique row number of the ranking.
+        """
+        units = func.sum(Course.unit)
+        totals = (
+            db.session.query(
+                User.id.label("user_id"),
+                User.student_id,
+                (cast(func.sum(Course.unit * cls.grade_points_expression()), db.Float) / func.nullif(units, 0)).label("gpa"),
+            )
+            .join(cls, cls.user_id == User.id)
+            .join(Course, Course.id == cls.course_id)
+            .filter(User.is_admin != True)
+        )
+        if course_id is not None:
+            totals = totals.filter(cls.course_id == course_id)
+        if admission_year is not None:
+            totals = totals.filter(extract("year", User.date_created) == admission_year)
+        # students whose courses all have 0 units have no gpa and are not ranked
+        totals = totals.group_by(User.id, User.student_id).having(units > 0).subquery()
+
+        ordering = totals.c.gpa.desc()
+        ranked = db.session.query(
+            totals.c.student_id,
+            totals.c.gpa,
+            func.rank().over(order_by=ordering).label("rank"),
+            func.dense_rank().over(order_by=ordering).label("dense_rank"),
+            func.percent_rank(type_=db.Float).over(order_by=ordering).label("percent_rank"),
+            func.row_number().over(order_by=(ordering, totals.c.user_id)).label("position"),
+        ).subquery()
+        return db.session.query(ranked), ranked
+
+    @classmethod
+    def course_statistics(cls, course_ids=None, top=5):
+        """
+        Summarises the scores of courses keyed by course id.
+        Counts, averages, extremes, pass rates, grade histograms and the top scores are
+        aggregated in SQL; the median and standard deviation come from one fetched score column.
+        """
+        def in_courses(query):
+            # scores left by deleted students are not counted, as they cannot be in the top scores
+            query = query.filter(cls.user_id.isnot(None))
+            if course_ids is None:
+                return query
+            return query.filter(cls.course_id.in_(course_ids))
+
+        courses = db.session.query(Course.id, Course.name).order_by(Course.id)
+        if course_ids is not None:
+            courses = courses.filter(Course.id.in_(course_ids))
+        stats = {
+            course.id: {
+                "course_id": course.id,
+                "name": course.name,
+                "count": 0,
+                "mean": None,
+                "median": None,
+                "std": None,
+                "min": None,
+                "max": None,
+                "pass_rate": None,
+                "histogram": dict.fromkeys(GRADE_POINTS, 0),
+                "top": [],
+            }
+            for course in courses
+        }
+
+        aggregates = in_courses(
+            db.session.query(
+                cls.course_id,
+                func.count(cls.id).label("count"),
+                func.avg(cls.score).label("mean"),
+                func.min(cls.score).label("min"),
+                func.max(cls.score).label("max"),
+                func.sum(case((cls.grade != "F", 1), else_=0)).label("passed"),
+            )
+        ).group_by(cls.course_id)
+        # scores of courses that no longer exist are skipped
+        for row in aggregates:
+            if row.course_id not in stats:
+                continue
+            stats[row.course_id].update(
+                count=row.count,
+                mean=round(float(row.mean), 2),
+                min=row.min,
+                max=row.max,
+                pass_rate=round(row.passed / row.count, 4),
+            )
+
+        histogram = in_courses(
+            db.session.query(cls.course_id, cls.grade, func.count(cls.id).label("count"))
+        ).group_by(cls.course_id, cls.grade)
+        for row in histogram:
+            if row.course_id in stats:
+                stats[row.course_id]["histogram"][row.grade] = row.count
+
+        scores = in_courses(db.session.query(cls.course_id, cls.score)).order_by(cls.course_id)
+        for course_id, rows in groupby(scores, key=lambda row: row.course_id):
+            if course_id not in stats:
+                continue
+            column = [row.score for row in rows]
+            stats[course_id].update(
+                median=statistics.median(column),
+                std=round(statistics.pstdev(column), 2),
+            )
+
+        position = func.row_number().over(
+            partition_by=cls.course_id, order_by=(cls.score.desc(), cls.user_id)
+        ).label("position")
+        ranked = in_courses(
+            db.session.query(cls.course_id, User.student_id, cls.score, cls.grade, position)
+            .join(User, User.id == cls.user_id)
+        ).subquery()
+        for row in db.session.query(ranked).filter(ranked.c.position <= top).order_by(ranked.c.course_id, ranked.c.position):
+            if row.course_id not in stats:
+                continue
+            stats[row.course_id]["top"].append(
+                {"student_id": row.student_id, "score": row.score, "grade": row.grade}
+            )
+        return stats
@@ -0,0 +1,96 @@
+import threading
+from datetime import date
+from flask import current_app
+from utils import db
+from utils.db import dialect_insert
+
+# ids below this were handed out at random before the counter existed
+FIRST_NUMBER = 10000
+
+
+class StudentIdCounter(db.Model):
+    """
+    The next free student number of each year
+    """
+    __tablename__ = 'student_id_counter'
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    next_number = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<StudentIdCounter {self.year} {self.next_number}>'
+
+    @classmethod
+    def reserve(cls, year, count, connection):
+        """
+        Reserves count consecutive numbers of a year in one UPDATE and returns the first
+        """
+        connection.execute(
+            dialect_insert(cls, connection.dialect).values(year=year, next_number=FIRST_NUMBER).on_conflict_do_nothing(index_elements=[cls.year])
+        )
+        end = connection.execute(
+            db.update(cls)
+            .where(cls.year == year)
+            .values(next_number=cls.next_number + count)
+            .returning(cls.next_number)
+        ).scalar_one()
+        return end - count
+
+
+def format_student_id(year, number):
+    return f"STA/{year}/{number}"
+
+
+class StudentIdAllocator:
+    """
+    Hands out student ids from blocks of STUDENT_ID_BLOCK_SIZE numbers reserved by this worker.
+    Blocks are reserved in their own transaction, so a rolled back signup leaves a gap but never
+    a number another worker can get. SQLite has a single writer, so there each reservation joins
+    the transaction of the session instead and no block is kept.
+    """
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self.blocks = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, count, year):
+        if db.engine.dialect.name == 'sqlite':
+            return StudentIdCounter.reserve(year, count, db.session.connection())
+        with db.engine.begin() as connection:
+            return StudentIdCounter.reserve(year, count, connection)
+
+    def next_id(self):
+        year = date.today().year
+        if db.engine.dialect.name == 'sqlite':
+            return format_student_id(year, self.reserve(1, year))
+        with self.lock:
+            number, end = self.blocks.get(year, (0, 0))
+            if number == end:
+                number = self.reserve(self.block_size, year)
+                end = number + self.block_size
+            self.blocks[year] = (number + 1, end)
+        return format_student_id(year, number)
+
+    def reserve_range(self, count):
+        """
+        Returns count consecutive student ids reserved in one statement, for bulk imports
+        """
+        year = date.today().year
+        first = self.reserve(count, year) if count else 0
+        return [format_student_id(year, number) for number in range(first, first + count)]
+
+
+def student_id_allocator():
+    allocator = current_app.extensions.get("student_ids")
+    if allocator is None:
+        allocator = StudentIdAllocator(current_app.config["STUDENT_ID_BLOCK_SIZE"])
+        current_app.extensions["student_ids"] = allocator
+    return allocator
+
+
+def generate_student_id():
+    return student_id_allocator().next_id()
+
+
+def generate_student_ids(count):
+    return student_id_allocator().reserve_range(count)
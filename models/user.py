@@ -1,10 +1,13 @@
 from utils import db
+from sqlalchemy.orm import load_only, selectinload
 from enum import Enum
 from datetime import datetime
 
 student_course = db.Table('user_course',
                     db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-                    db.Column('course_id', db.Integer, db.ForeignKey('course.id'))
+                    db.Column('course_id', db.Integer, db.ForeignKey('course.id')),
+                    db.Index('uq_user_course_user_id_course_id', 'user_id', 'course_id', unique=True),
+                    db.Index('ix_user_course_course_id', 'course_id')
                     )
 
 class EnrollmentStatus(Enum):
@@ -12,8 +15,15 @@ class EnrollmentStatus(Enum):
     WAITLIST = 'in_waitlist'
     EXPELLED = 'expelled'
     ADMIN = 'admin'
+
+# statuses an admin can move a student to
+STUDENT_STATUSES = (EnrollmentStatus.ACTIVE, EnrollmentStatus.WAITLIST, EnrollmentStatus.EXPELLED)
     
 
+# user fields that can be picked in responses, all served by default
+USER_FIELDS = ('id', 'first_name', 'last_name', 'email', 'student_id', 'enrollment_status', 'is_admin', 'date_created')
+
+
 class User(db.Model):
     __tablename__='user'
     id = db.Column(db.Integer, autoincrement=True, primary_key=True)
@@ -23,11 +33,16 @@ class User(db.Model):
     email = db.Column(db.String(50), nullable=False, unique=True)
     password = db.Column(db.String, nullable=False)
     enrollment_status = db.Column(db.Enum(EnrollmentStatus), nullable=False, default=EnrollmentStatus.WAITLIST)
-    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False)
+    # running totals of the scored courses, kept in step with the score table
+    total_units = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_grade_points = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     courses = db.relationship('Course', secondary=student_course, backref='users')
     scores = db.relationship('Score', backref='user')
 
+    __table_args__ = (db.Index('ix_user_date_created_id', 'date_created', 'id'),)
+
     def __repr__(self):
         return f'<User {self.student_id}>'
 
@@ -36,12 +51,54 @@ class User(db.Model):
         db.session.commit()
 
     @classmethod
-    def get_by_id(cls, id):
-        return cls.query.get_or_404(id)
+    def get_by_id(cls, id, *options):
+        return cls.query.options(*options).get_or_404(id)
+
+    @classmethod
+    def field_options(cls, fields, include, *extra_columns):
+        """
+        Loader options that load only the columns and relationships a response needs
+        """
+        columns = [getattr(cls, field) for field in fields or USER_FIELDS]
+        options = [load_only(*columns, *extra_columns)]
+        if "courses" in include:
+            options.append(selectinload(cls.courses))
+        return options
+
+    @classmethod
+    def sort_columns(cls, sort):
+        """
+        Returns the keyset columns for a sort field, ending with the unique id
+        """
+        if sort == 'date_created':
+            return (cls.date_created, cls.id)
+        return (cls.id,)
+
+    @property
+    def gpa(self):
+        if not self.total_units:
+            return None
+        return round(self.total_grade_points / self.total_units, 2)
+
+    @classmethod
+    def add_grade_points(cls, id, units, grade_points):
+        """
+        Adds to the gpa totals of a user in the current transaction
+        """
+        db.session.execute(
+            db.update(cls)
+            .where(cls.id == id)
+            .values(
+                total_units=cls.total_units + units,
+                total_grade_points=cls.total_grade_points + grade_points,
+            )
+        )
 
     def make_admin(self):
         """
         Gives user admin privileges
         """
         self.is_admin = True
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+        from models.principal import invalidate_principals
+        invalidate_principals(self.id)
\ No newline at end of file
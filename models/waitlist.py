@@ -0,0 +1,19 @@
+from utils import db
+from datetime import datetime
+
+
+class CourseWaitlist(db.Model):
+    __tablename__ = 'course_waitlist'
+    # the autoincrement id orders the waitlist
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'course_id'),
+        db.Index('ix_course_waitlist_course_id_id', 'course_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<CourseWaitlist {self.course_id} {self.user_id}>'
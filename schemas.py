@@ -1,11 +1,14 @@
-from marshmallow import Schema, fields
-from models.user import EnrollmentStatus
+from marshmallow import Schema, fields, validate, validates_schema, ValidationError
+from flask_smorest.fields import Upload
+from webargs.fields import DelimitedList
+from models.user import EnrollmentStatus, STUDENT_STATUSES, USER_FIELDS
 
 class PlainCourseSchema(Schema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True)
     teacher = fields.Str(required=True)
     unit = fields.Int(required=True)
+    capacity = fields.Int(allow_none=True, validate=validate.Range(min=0))
 
 class PlainUserSchema(Schema):
     id = fields.Int(dump_only=True)
@@ -30,16 +33,125 @@ class AdminChangePasswordSchema(AdminLoginSchema):
     confirm_new_password = fields.Str(required=True)
 
 class ChangeEnrollmentStatusSchema(Schema):
-    enrollment_status = fields.Enum(EnrollmentStatus, by_value=True)
+    enrollment_status = fields.Enum(EnrollmentStatus, by_value=True, validate=validate.OneOf(STUDENT_STATUSES))
 
 class UserSchema(PlainUserSchema):
     student_id = fields.Str(dump_only=True)
-    password = fields.Str(required=True)
+    password = fields.Str(load_only=True)
     enrollment_status = fields.Enum(EnrollmentStatus, by_value=True)
     is_admin = fields.Boolean()
     date_created = fields.DateTime()
     courses = fields.List(fields.Nested(PlainCourseSchema()))
 
+    @classmethod
+    def for_args(cls, args, many=False):
+        """
+        Returns a schema that dumps only the fields and relationships asked for in UserFieldsArgsSchema args
+        """
+        return cls(only=[*(args.get("only_fields") or USER_FIELDS), *args["include"]], many=many)
+
+class UserFieldsArgsSchema(Schema):
+    include = DelimitedList(fields.Str(validate=validate.OneOf(["courses"])), load_default=[])
+    only_fields = DelimitedList(fields.Str(validate=validate.OneOf(USER_FIELDS)), data_key="fields")
+
+class StudentIdListSchema(Schema):
+    student_ids = fields.List(fields.Str(), required=True, validate=validate.Length(min=1, max=1000))
+
 class ScoreUploadSchema(Schema):
     student_id = fields.Str(required=True)
     score = fields.Int()
+
+class PaginationArgsSchema(Schema):
+    limit = fields.Int(load_default=50, validate=validate.Range(min=1, max=1000))
+    cursor = fields.Str()
+
+class UserListArgsSchema(PaginationArgsSchema, UserFieldsArgsSchema):
+    sort = fields.Str(load_default="id", validate=validate.OneOf(["id", "date_created"]))
+    order = fields.Str(load_default="asc", validate=validate.OneOf(["asc", "desc"]))
+    enrollment_status = fields.Enum(EnrollmentStatus, by_value=True)
+
+class CourseListArgsSchema(PaginationArgsSchema):
+    teacher = fields.Str()
+
+class RankingArgsSchema(PaginationArgsSchema):
+    course_id = fields.Int()
+    admission_year = fields.Int()
+    top = fields.Int(validate=validate.Range(min=1))
+
+class StudentRankingSchema(Schema):
+    student_id = fields.Str()
+    gpa = fields.Function(lambda row: round(row.gpa, 2))
+    rank = fields.Int()
+    dense_rank = fields.Int()
+    # share of the cohort ranked at or below the student
+    percentile = fields.Function(lambda row: round(100 * (1 - row.percent_rank), 2))
+
+class RosterExportArgsSchema(Schema):
+    format = fields.Str(load_default="csv", validate=validate.OneOf(["csv", "ndjson"]))
+
+class BulkEnrollmentStatusSchema(Schema):
+    enrollment_status = fields.Enum(EnrollmentStatus, by_value=True, required=True, validate=validate.OneOf(STUDENT_STATUSES))
+    ids = fields.List(fields.Int(), validate=validate.Length(min=1, max=10000))
+    student_id_prefix = fields.Str(validate=validate.Length(min=1))
+    current_status = fields.Enum(EnrollmentStatus, by_value=True)
+
+    @validates_schema
+    def validate_selection(self, data, **kwargs):
+        selectors = [key for key in ("ids", "student_id_prefix", "current_status") if key in data]
+        if len(selectors) != 1:
+            raise ValidationError("Select students with exactly one of ids, student_id_prefix or current_status")
+
+class ScoreRowSchema(ScoreUploadSchema):
+    score = fields.Int(required=True)
+
+class BatchScoreUploadSchema(Schema):
+    scores = fields.List(fields.Nested(ScoreRowSchema()), required=True, validate=validate.Length(min=1, max=5000))
+
+class IdListSchema(Schema):
+    ids = fields.List(fields.Int(), required=True, validate=validate.Length(min=1, max=10000))
+
+class CourseStatisticsArgsSchema(Schema):
+    top = fields.Int(load_default=5, validate=validate.Range(min=1, max=100))
+
+class GradeBoundarySchema(Schema):
+    grade = fields.Str(required=True, validate=validate.OneOf(["A", "B", "C", "D", "E", "F"]))
+    min_score = fields.Int(required=True, validate=validate.Range(min=0))
+
+class GradingSchemeSchema(Schema):
+    id = fields.Int(dump_only=True)
+    name = fields.Str(required=True)
+    is_default = fields.Boolean(load_default=False)
+    boundaries = fields.List(fields.Nested(GradeBoundarySchema()), required=True, validate=validate.Length(min=1))
+
+    @validates_schema
+    def validate_boundaries(self, data, **kwargs):
+        grades = [boundary["grade"] for boundary in data.get("boundaries", [])]
+        if len(grades) != len(set(grades)):
+            raise ValidationError("Each grade can have only one boundary", "boundaries")
+
+class CourseGradingSchemeSchema(Schema):
+    grading_scheme_id = fields.Int(required=True, allow_none=True)
+
+class RegradeSchema(Schema):
+    course_id = fields.Int()
+
+class CourseCapacitySchema(Schema):
+    capacity = fields.Int(required=True, allow_none=True, validate=validate.Range(min=0))
+
+class StudentImportSchema(Schema):
+    file = Upload(required=True)
+
+class AuditLogArgsSchema(PaginationArgsSchema):
+    actor_id = fields.Int()
+    action = fields.Str()
+    target_type = fields.Str(validate=validate.OneOf(["student", "admin"]))
+    target_id = fields.Int()
+
+class AuditLogSchema(Schema):
+    id = fields.Int()
+    actor_id = fields.Int()
+    action = fields.Str()
+    target_type = fields.Str()
+    target_id = fields.Int()
+    details = fields.Dict()
+    created_at = fields.DateTime()
@@ -0,0 +1,111 @@
+import csv
+import io
+from itertools import islice
+from flask import current_app
+from marshmallow import EXCLUDE
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+from models.outbox import student_reset_password_email
+from models.user import User
+from models.student_id import generate_student_ids
+from schemas import PlainUserSchema
+from utils import db
+from utils.passwords import default_password, hash_passwords
+
+REPORT_COLUMNS = ["row", "email", "result", "student_id", "message"]
+
+
+def read_rows(lines):
+    """
+    Yields the numbered rows of a csv file with a first_name, last_name and email header
+    """
+    # the header is row 1
+    for number, row in enumerate(csv.DictReader(lines), start=2):
+        yield number, row
+
+
+def import_chunk(rows):
+    """
+    Creates the students of a chunk of rows in one transaction and queues their welcome emails.
+    Returns a report entry for every row
+    """
+    schema = PlainUserSchema(unknown=EXCLUDE)
+    report = {}
+    students = {}
+    for number, row in rows:
+        row = {key: (value or "").strip() for key, value in row.items() if key}
+        errors = schema.validate(row)
+        blank = [column for column in ("first_name", "last_name", "email") if not row.get(column)]
+        if errors or blank:
+            message = "; ".join(sorted(set(errors) | set(blank))) + " missing or invalid"
+            report[number] = {"email": row.get("email"), "result": "invalid", "message": message}
+        elif row["email"] in students:
+            report[number] = {"email": row["email"], "result": "duplicate", "message": "Email repeated in the file"}
+        else:
+            students[row["email"]] = (number, schema.load(row))
+
+    created = False
+    for _ in range(2):
+        existing = set(db.session.scalars(db.select(User.email).where(User.email.in_(list(students)))))
+        new = [(number, data) for email, (number, data) in students.items() if email not in existing]
+        try:
+            passwords = [default_password(data) for _, data in new]
+            users = [
+                User(
+                    first_name=data["first_name"],
+                    last_name=data["last_name"],
+                    email=data["email"],
+                    password=password_hash,
+                    student_id=student_id,
+                )
+                for (_, data), password_hash, student_id in zip(
+                    new, hash_passwords(passwords), generate_student_ids(len(new))
+                )
+            ]
+            db.session.add_all(users)
+            for user, password in zip(users, passwords):
+                student_reset_password_email(user, password)
+            db.session.commit()
+            created = True
+            break
+        except IntegrityError:
+            # a student with one of the emails was created meanwhile, so the chunk is checked again
+            db.session.rollback()
+        except HTTPException:
+            # the password hasher is saturated or timed out, so the chunk is not retried
+            db.session.rollback()
+            break
+    if not created:
+        # earlier chunks are committed and streamed already, so the rest of the report still goes out
+        for number, data in new:
+            report[number] = {"email": data["email"], "result": "error", "message": "Not created, import the row again"}
+        users = []
+
+    for email in existing:
+        report[students[email][0]] = {"email": email, "result": "exists", "message": "User exists"}
+    for (number, _), user in zip(new, users):
+        report[number] = {"email": user.email, "result": "created", "student_id": user.student_id}
+    return [{"row": number, **report[number]} for number in sorted(report)]
+
+
+def import_students(lines):
+    """
+    Imports students from the lines of a csv file a chunk at a time, so the file is never held in memory.
+    Yields a report entry for every row
+    """
+    rows = read_rows(lines)
+    while chunk := list(islice(rows, current_app.config["STUDENT_IMPORT_CHUNK_SIZE"])):
+        yield from import_chunk(chunk)
+
+
+def import_report_csv(lines):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=REPORT_COLUMNS)
+    writer.writeheader()
+    for number, entry in enumerate(import_students(lines), start=1):
+        writer.writerow(entry)
+        if number % current_app.config["STUDENT_IMPORT_CHUNK_SIZE"] == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -1,53 +1,305 @@
+import csv
+import io
+import json
+from collections import Counter
+from itertools import groupby
+from flask import Response, jsonify, stream_with_context
 from flask.views import MethodView
 from flask_smorest import Blueprint
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
+from sqlalchemy import and_
 from models.user import User, EnrollmentStatus, student_course
+from models.principal import current_principal, invalidate_principals
+from models.courses import Course
 from schemas import (
     UserSchema,
+    UserListArgsSchema,
+    UserFieldsArgsSchema,
+    StudentIdListSchema,
+    RankingArgsSchema,
+    StudentRankingSchema,
+    RosterExportArgsSchema,
+    BulkEnrollmentStatusSchema,
     StudentChangePasswordSchema,
     ChangeEnrollmentStatusSchema,
+    StudentImportSchema,
 )
 from utils import db
-from werkzeug.security import check_password_hash, generate_password_hash
-from utils import admin_required, grade_to_point_converter
+from utils.passwords import check_password, hash_password
+from utils import admin_required, keyset_paginate, pagination_header
+from utils.ratelimit import rate_limit
 from http import HTTPStatus
-from models.courses import Course
 from models.scores import Score
+from models.enrollment import unenroll_all
+from models.audit import audit
+from student.importer import import_report_csv
 
 blp = Blueprint("students", __name__, description="Operations on students")
 
 
 @blp.route("/student")
 class StudentList(MethodView):
-    @blp.response(200, UserSchema(many=True))
+    @blp.arguments(UserListArgsSchema, location="query")
+    @blp.alt_response(200, schema=UserSchema(many=True), success=True)
     @blp.doc(
-        description="Get all registered students. Can be accessed by only an admin"
+        description="Get registered students a page at a time. Can be accessed by only an admin."
+        " The cursor of the next page is returned in the X-Pagination header."
+        " Pick the fields returned with fields=id,student_id and add the courses with include=courses"
     )
     @jwt_required()
     @admin_required()
-    def get(self):
+    def get(self, args):
         """
         Get all students
         """
-        students = User.query.filter(User.is_admin != True)
-        return students, HTTPStatus.OK
+        # only the fields asked for are loaded, and courses for the whole page in one IN query
+        options = User.field_options(args.get("only_fields"), args["include"], *User.sort_columns(args["sort"]))
+        query = User.query.options(*options).filter(User.is_admin != True)
+        if "enrollment_status" in args:
+            query = query.filter(User.enrollment_status == args["enrollment_status"])
+        students, next_cursor = keyset_paginate(
+            query,
+            User.sort_columns(args["sort"]),
+            args["limit"],
+            cursor=args.get("cursor"),
+            descending=args["order"] == "desc",
+        )
+        return (
+            jsonify(UserSchema.for_args(args, many=True).dump(students)),
+            HTTPStatus.OK,
+            pagination_header(next_cursor, args["limit"]),
+        )
+
+
+@blp.route("/student/rankings")
+class StudentRankings(MethodView):
+    @blp.arguments(RankingArgsSchema, location="query")
+    @blp.response(200, StudentRankingSchema(many=True))
+    @blp.doc(
+        description="Rank students by gpa, optionally in one course or admission year. Can be accessed by only an admin."
+        " Pass top to keep only the students ranked top or better."
+        " The cursor of the next page is returned in the X-Pagination header"
+    )
+    @jwt_required()
+    @admin_required()
+    def get(self, args):
+        """
+        Get student rankings
+        """
+        query, ranked = Score.ranking_query(
+            course_id=args.get("course_id"), admission_year=args.get("admission_year")
+        )
+        if "top" in args:
+            query = query.filter(ranked.c.rank <= args["top"])
+        rankings, next_cursor = keyset_paginate(
+            query, (ranked.c.position,), args["limit"], cursor=args.get("cursor")
+        )
+        return rankings, HTTPStatus.OK, pagination_header(next_cursor, args["limit"])
+
+
+ROSTER_COLUMNS = ["id", "student_id", "first_name", "last_name", "email", "enrollment_status", "courses"]
+ROSTER_CHUNK_SIZE = 1000
+
+
+def roster_rows():
+    """
+    Streams every student with their course names from one server side cursor.
+    The rows are read in a single repeatable read transaction so the export is a consistent snapshot.
+    """
+    statement = (
+        db.select(
+            User.id,
+            User.student_id,
+            User.first_name,
+            User.last_name,
+            User.email,
+            User.enrollment_status,
+            Course.name.label("course"),
+        )
+        .outerjoin(student_course, student_course.c.user_id == User.id)
+        .outerjoin(Course, Course.id == student_course.c.course_id)
+        .where(User.is_admin != True)
+        .order_by(User.id, Course.id)
+    )
+    with db.engine.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execution_options(isolation_level="REPEATABLE READ")
+        result = connection.execution_options(
+            stream_results=True, yield_per=ROSTER_CHUNK_SIZE
+        ).execute(statement)
+        # rows of one student are adjacent because of the ordering on user id
+        for _, rows in groupby(result, key=lambda row: row.id):
+            rows = list(rows)
+            first = rows[0]
+            yield {
+                "id": first.id,
+                "student_id": first.student_id,
+                "first_name": first.first_name,
+                "last_name": first.last_name,
+                "email": first.email,
+                "enrollment_status": first.enrollment_status.value,
+                "courses": [row.course for row in rows if row.course is not None],
+            }
+
+
+def roster_csv():
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ROSTER_COLUMNS)
+    writer.writeheader()
+    for number, student in enumerate(roster_rows(), start=1):
+        writer.writerow({**student, "courses": ";".join(student["courses"])})
+        if number % ROSTER_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def roster_ndjson():
+    lines = []
+    for student in roster_rows():
+        lines.append(json.dumps(student) + "\n")
+        if len(lines) == ROSTER_CHUNK_SIZE:
+            yield "".join(lines)
+            lines = []
+    yield "".join(lines)
+
+
+@blp.route("/student/export")
+class StudentRosterExport(MethodView):
+    @blp.arguments(RosterExportArgsSchema, location="query")
+    @blp.doc(
+        description="Stream the roster of all students with their courses as csv or ndjson."
+        " Can be accessed by only an admin"
+    )
+    @jwt_required()
+    @admin_required()
+    def get(self, args):
+        """
+        Export the student roster
+        """
+        if args["format"] == "ndjson":
+            return Response(
+                stream_with_context(roster_ndjson()), mimetype="application/x-ndjson"
+            )
+        return Response(
+            stream_with_context(roster_csv()),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=roster.csv"},
+        )
+
+
+@blp.route("/student/import")
+class StudentImport(MethodView):
+    @blp.arguments(StudentImportSchema, location="files")
+    @blp.doc(
+        description="Register students from a csv file with first_name, last_name and email columns."
+        " Can be accessed by only an admin. Students are created a chunk at a time and their welcome emails are queued."
+        " Streams back a csv report with the result of every row"
+    )
+    @jwt_required()
+    @admin_required()
+    def post(self, args):
+        """
+        Import students from csv
+        """
+        lines = io.TextIOWrapper(args["file"].stream, encoding="utf-8-sig", newline="")
+        return Response(
+            stream_with_context(import_report_csv(lines)),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=import-report.csv"},
+        )
+
+
+@blp.route("/student/enrollment-status")
+class StudentBulkEnrollmentStatus(MethodView):
+    @blp.arguments(BulkEnrollmentStatusSchema)
+    @blp.doc(
+        description="Change the enrollment status of many students in one transaction. Can be accessed by only an admin."
+        " Students are selected by a list of ids, a student_id prefix or their current status."
+        " Expelled students are never reinstated in bulk, use the single student route for that."
+    )
+    @jwt_required()
+    @admin_required()
+    def put(self, data):
+        """
+        Update enrollment status of many students
+        """
+        target = data["enrollment_status"]
+        if "ids" in data:
+            selection = User.id.in_(data["ids"])
+        elif "student_id_prefix" in data:
+            selection = User.student_id.startswith(data["student_id_prefix"], autoescape=True)
+        else:
+            selection = User.enrollment_status == data["current_status"]
+        selection = and_(selection, User.is_admin != True)
+
+        # locks the selected rows so the outcomes reported match the update below
+        students = (
+            db.session.query(User.id, User.student_id, User.enrollment_status)
+            .filter(selection)
+            .order_by(User.id)
+            .with_for_update()
+            .all()
+        )
+        results = []
+        for student in students:
+            if student.enrollment_status == target:
+                result = {"result": "unchanged"}
+            elif student.enrollment_status == EnrollmentStatus.EXPELLED:
+                result = {"result": "rejected", "message": "Student has been expelled"}
+            else:
+                result = {"result": "updated"}
+            results.append({"id": student.id, "student_id": student.student_id, **result})
+        if "ids" in data:
+            found = {student.id for student in students}
+            results.extend(
+                {"id": id, "student_id": None, "result": "rejected", "message": "Student does not exist"}
+                for id in dict.fromkeys(data["ids"])
+                if id not in found
+            )
+
+        db.session.execute(
+            db.update(User)
+            .where(
+                selection,
+                User.enrollment_status != target,
+                User.enrollment_status != EnrollmentStatus.EXPELLED,
+            )
+            .values(enrollment_status=target),
+            execution_options={"synchronize_session": False},
+        )
+        db.session.commit()
+        updated = [result["id"] for result in results if result["result"] == "updated"]
+        invalidate_principals(*updated)
+        for id in updated:
+            audit("change_status", "student", id, enrollment_status=target.value)
+        counts = Counter(result["result"] for result in results)
+        return {
+            "updated": counts["updated"],
+            "unchanged": counts["unchanged"],
+            "rejected": counts["rejected"],
+            "results": results,
+        }, HTTPStatus.OK
 
 
 @blp.route("/student/<int:student_id>")
 class Student(MethodView):
     @blp.doc(
-        description="Get a student by id. Can be accessed by only an admin",
+        description="Get a student by id. Can be accessed by only an admin."
+        " Pick the fields returned with fields=id,student_id and add the courses with include=courses",
         params={"student_id": "The id of the student"},
     )
-    @blp.response(200, UserSchema)
+    @blp.arguments(UserFieldsArgsSchema, location="query")
+    @blp.alt_response(200, schema=UserSchema, success=True)
     @jwt_required()
     @admin_required()
-    def get(self, student_id):
+    def get(self, args, student_id):
         """
         Get a student by id
         """
-        student = User.get_by_id(student_id)
-        return student, HTTPStatus.OK
+        student = User.get_by_id(student_id, *User.field_options(args.get("only_fields"), args["include"]))
+        return jsonify(UserSchema.for_args(args).dump(student)), HTTPStatus.OK
 
     @blp.doc(
         description="Update a student enrollment by id. Can be accessed by only an admin."
@@ -65,6 +317,8 @@ class Student(MethodView):
         student = User.get_by_id(student_id)
         student.enrollment_status = data["enrollment_status"]
         db.session.commit()
+        invalidate_principals(student.id)
+        audit("change_status", "student", student.id, enrollment_status=data["enrollment_status"].value)
         return student, HTTPStatus.OK
 
     @blp.doc(
@@ -79,8 +333,14 @@ class Student(MethodView):
         """
         user = User.get_by_id(student_id)
 
+        promoted = unenroll_all(user.id)
         db.session.delete(user)
         db.session.commit()
+        invalidate_principals(student_id)
+        audit("delete", "student", student_id)
+        for course_id, user_ids in promoted.items():
+            for user_id in user_ids:
+                audit("promote", "student", user_id, course_id=course_id)
 
         return {"message": "Student deleted"}, HTTPStatus.OK
 
@@ -88,6 +348,7 @@ class Student(MethodView):
 class StudentChangePassword(MethodView):
     @blp.arguments(StudentChangePasswordSchema)
     @blp.doc(description="Change student password.")
+    @rate_limit("change_password", account="student_id")
     def put(self, user_data):
         """
         Student change password route
@@ -95,15 +356,16 @@ class StudentChangePassword(MethodView):
         user = User.query.filter_by(student_id=user_data["student_id"]).first()
 
         # checks if user exists and password matches
-        if user and check_password_hash(user.password, user_data["password"]):
+        if user and check_password(user.password, user_data["password"]):
             # checks if user has been expelled
             if user.enrollment_status == EnrollmentStatus.EXPELLED:
                 return {"Error": "You are no longer a student"}, HTTPStatus.UNAUTHORIZED
             # check if the new_password field and confirm_new_password field is the same
             if user_data["new_password"] == user_data["confirm_new_password"]:
-                user.password = generate_password_hash(user_data["new_password"])
+                user.password = hash_password(user_data["new_password"])
                 user.enrollment_status = "ACTIVE"
                 db.session.commit()
+                invalidate_principals(user.id)
                 return {
                     "message": "Password successfully changed. Proceed to login"
                 }, HTTPStatus.OK
@@ -128,33 +390,24 @@ class StudentScoreList(MethodView):
         "Student cannot access the route if expelled.",
         params={"student_id": "The student_id of the student"},
     )
+    @rate_limit("score_sheet")
     def get(self, student_id):
         """
         Get student scores and grades
         """
-        identity = get_jwt_identity()
-        user = User.get_by_id(identity)
+        user = current_principal()
 
-        score_course_list = []
         student = User.query.filter_by(student_id=student_id).first()
         # check if student exists
         if student:
             # checks if the user accessing the route is an admin or the student whose course list is needed.
-            if (user.is_admin == True) or (identity == student.id):
-                for course in student.courses:
-                    score_in_course = {}
-                    score = Score.query.filter_by(
-                        user_id=student.id, course_id=course.id
-                    ).first()
-                    score_in_course["name"] = course.name
-                    # checks if the course has a score
-                    if score:
-                        score_in_course["score"] = score.score
-                        score_in_course["grade"] = score.grade
-                    else:
-                        score_in_course["score"] = None
-                        score_in_course["grade"] = None
-                    score_course_list.append(score_in_course)
+            if user.is_admin or (user.id == student.id):
+                rows = Score.score_sheet_query().filter(User.id == student.id)
+                score_course_list = [
+                    {"name": row.name, "score": row.score, "grade": row.grade}
+                    for row in rows
+                    if row.name is not None
+                ]
                 return score_course_list, HTTPStatus.OK
             return {"message": "Not allowed."}, HTTPStatus.FORBIDDEN
         return {"message": "Student does not exist"}, HTTPStatus.NOT_FOUND
@@ -169,41 +422,55 @@ class StudentCGPA(MethodView):
         "Student cannot access the route if expelled.",
         params={"student_id": "The student_id of the student"},
     )
+    @rate_limit("gpa")
     def get(self, student_id):
         """
         Get student gpa
         """
-        identity = get_jwt_identity()
-        user = User.get_by_id(identity)
+        user = current_principal()
         student = User.query.filter_by(student_id=student_id).first()
         # checks if student exists
         if student:
             # checks if the user accessing the route is an admin or the student whose course list is needed.
-            if (user.is_admin == True) or (identity == student.id):
-                courses = (
-                    Course.query.join(student_course)
-                    .join(User)
-                    .filter(User.id == student.id)
-                    .all()
-                )
-                total_credit_units = 0
-                obtained_score = 0
-                for course in courses:
-                    score = Score.query.filter_by(
-                        user_id=student.id, course_id=course.id
-                    ).first()
-                    # checks if score exists
-                    if score:
-                        score_grade = grade_to_point_converter(score.grade)
-                        total_credit_units += course.unit
-                        obtained_score += course.unit * score_grade
-
+            if user.is_admin or (user.id == student.id):
+                # the gpa totals are kept up to date on every score change
+                gpa = student.gpa
                 # checks if the student has no score in any course
-                if total_credit_units == 0:
+                if gpa is None:
                     return {
                         "message": "Student has no score. Try uploading a score!."
                     }, HTTPStatus.OK
-                gpa = round((obtained_score / total_credit_units), 2)
                 return {"message": f"GPA for {student_id} is {gpa}"}, HTTPStatus.OK
             return {"message": "Not allowed."}, HTTPStatus.FORBIDDEN
         return {"message": "Student does not exist"}, HTTPStatus.NOT_FOUND
+
+
+@blp.route("/student/scores")
+class StudentScoreSheets(MethodView):
+    @blp.arguments(StudentIdListSchema)
+    @jwt_required()
+    @admin_required()
+    @blp.doc(
+        description="Get the scores of many students in each course in one request."
+        " Takes a list of student_ids. This route can be accessed by only an admin."
+    )
+    @rate_limit("score_sheet")
+    def post(self, data):
+        """
+        Get scores and grades of many students
+        """
+        score_sheets = {}
+        for row in Score.score_sheet_query().filter(
+            User.student_id.in_(data["student_ids"])
+        ):
+            score_course_list = score_sheets.setdefault(row.student_id, [])
+            if row.name is not None:
+                score_course_list.append(
+                    {"name": row.name, "score": row.score, "grade": row.grade}
+                )
+        not_found = [
+            student_id
+            for student_id in dict.fromkeys(data["student_ids"])
+            if student_id not in score_sheets
+        ]
+        return {"scores": score_sheets, "not_found": not_found}, HTTPStatus.OK
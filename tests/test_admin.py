@@ -1,9 +1,19 @@
 import unittest
+from unittest import mock
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
 from config.config import config_dict
 from app import create_app
 from utils import db
 from models.user import User
 from flask_jwt_extended import create_access_token
+from models.audit import AuditLog, audit_buffer
+from utils.db import TimedQueuePool
+from sqlalchemy import create_engine, exc, text
 
 class AdminTestCase(unittest.TestCase):
     def setUp(self):
@@ -95,3 +105,158 @@ class AdminTestCase(unittest.TestCase):
 
         assert response.json == {"message": "Admin deleted"}
 
+    def test_audit_log(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        self.client.post('/course', headers=headers, json={"name": "Physics", "teacher": "Prof", "unit": 1})
+        student_signup_data = {
+            "first_name": "test",
+            "last_name": "user",
+            "email": "testuser@gmail.com",
+            }
+        self.client.post('/students/signup', json=student_signup_data, headers=headers)
+        student = User.query.filter_by(email='testuser@gmail.com').first()
+
+        self.client.put('/course/1/enroll/2', headers=headers)
+        self.client.put('/course/1/score-upload', headers=headers, json={"student_id": student.student_id, "score": 65})
+        self.client.put('/student/2', headers=headers, json={"enrollment_status": "expelled"})
+
+        # buffered until the flusher runs
+        assert AuditLog.query.count() == 0
+        audit_buffer().flush()
+
+        response = self.client.get('/admin/audit?limit=2', headers=headers)
+
+        assert response.status_code == 200
+        assert [(event["action"], event["actor_id"], event["target_id"]) for event in response.json] == [
+            ("change_status", admin.id, 2),
+            ("grade", admin.id, 2),
+        ]
+        assert response.json[1]["details"] == {"course_id": 1, "score": 65, "grade": "B"}
+
+        next_cursor = json.loads(response.headers["X-Pagination"])["next"]
+        response = self.client.get(f'/admin/audit?cursor={next_cursor}', headers=headers)
+
+        assert [event["action"] for event in response.json] == ["enroll"]
+
+        response = self.client.get('/admin/audit?action=grade', headers=headers)
+
+        assert len(response.json) == 1
+
+    def test_audit_log_spill(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.app.config["AUDIT_QUEUE_SIZE"] = 1
+            self.app.config["AUDIT_SPILL_FILE"] = os.path.join(directory, "spill.jsonl")
+            buffer = audit_buffer()
+            for target_id in (1, 2, 3):
+                buffer.record({
+                    "actor_id": 1,
+                    "action": "delete",
+                    "target_type": "student",
+                    "target_id": target_id,
+                    "details": None,
+                    "created_at": datetime.utcnow(),
+                })
+
+            # the queue holds one event and the rest wait in the spill file
+            assert buffer.events.qsize() == 1
+            with open(self.app.config["AUDIT_SPILL_FILE"]) as file:
+                assert len(file.readlines()) == 2
+            # a line cut short by a crash is skipped
+            with open(self.app.config["AUDIT_SPILL_FILE"], "a") as file:
+                file.write('{"actor_id": 1, "act')
+
+            buffer.flush()
+
+            assert sorted(event.target_id for event in AuditLog.query) == [1, 2, 3]
+            assert os.listdir(directory) == []
+
+            # the flusher outlives a failed flush
+            def failing_flush():
+                buffer.stop.set()
+                raise OSError("disk full")
+
+            with mock.patch.object(buffer, "flush", side_effect=failing_flush):
+                buffer.run()
+
+    def test_database_pool(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        response = self.client.get('/admin/db-pool', headers=headers)
+
+        assert response.status_code == 200
+        assert response.json["pool"] == "StaticPool"
+        assert response.json["worker"] == os.getpid()
+
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(
+                "sqlite:///" + os.path.join(directory, "pool.db"),
+                poolclass=TimedQueuePool,
+                pool_size=1,
+                max_overflow=0,
+                pool_timeout=0.1,
+            )
+            connection = engine.connect()
+            with self.assertRaises(exc.TimeoutError):
+                engine.connect()
+            connection.close()
+
+            # the timed out attempt is not a checkout and its wait is counted apart
+            stats = engine.pool.stats()
+            assert (stats["checkouts"], stats["timeouts"]) == (1, 1)
+            assert stats["wait_seconds_max"] < 0.1
+            assert stats["timeout_wait_seconds_mean"] >= 0.1
+            engine.dispose()
+
+            # opening a connection is not counted as waiting for one
+            def slow_connect():
+                time.sleep(0.2)
+                return sqlite3.connect(os.path.join(directory, "pool.db"))
+
+            engine = create_engine("sqlite://", creator=slow_connect, poolclass=TimedQueuePool, pool_size=1)
+            engine.connect().close()
+            stats = engine.pool.stats()
+            assert stats["checkouts"] == 1
+            assert stats["wait_seconds_max"] < 0.1
+            engine.dispose()
+
+    def test_sqlite_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            class FileConfig(config_dict['test']):
+                SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(directory, "test.db")
+
+            app = create_app(config=FileConfig)
+            with app.app_context():
+                with db.engine.connect() as connection:
+                    assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+                    assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+                assert isinstance(db.engine.pool, TimedQueuePool)
+                db.engine.dispose()
@@ -3,7 +3,17 @@ from config.config import config_dict
 from app import create_app
 from utils import db
 from models.user import User
-from flask_jwt_extended import create_access_token, create_refresh_token
+from models.blocklist import TokenBlocklist, utcnow
+from datetime import timedelta
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash, check_password_hash
+from utils.passwords import PasswordHasher
+from utils import mail
+from models.outbox import EmailOutbox
+from unittest import mock
+import smtplib
+from models.rate_limit import RateLimitBucket, DatabaseBucketBackend
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
 
 class AuthenticationTestCase(unittest.TestCase):
     def setUp(self):
@@ -141,3 +151,227 @@ class AuthenticationTestCase(unittest.TestCase):
         response = self.client.delete('/logout', headers=header)
         assert response.status_code == 200
         assert response.json == {"message": "User successfully logged out"}
+
+        response = self.client.delete('/logout', headers=header)
+        assert response.status_code == 401
+
+    def test_revocation_cache(self):
+        admin_signup_data = {
+            "first_name": "Test",
+            "last_name": "Admin",
+            "email": "testadmin@gmail.com"
+        }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        header = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        response = self.client.get('/admin', headers=header)
+        assert response.status_code == 200
+
+        # revoked by another worker, seen here once the cache is refreshed
+        jti = decode_token(token)["jti"]
+        db.session.add(TokenBlocklist(jti=jti, created_at=utcnow()))
+        db.session.add(TokenBlocklist(jti="expired", created_at=utcnow() - timedelta(days=1)))
+        db.session.commit()
+        response = self.client.get('/admin', headers=header)
+        assert response.status_code == 200
+
+        TokenBlocklist.revocation_cache().refreshed_at = None
+        response = self.client.get('/admin', headers=header)
+        assert response.status_code == 401
+        assert "expired" not in TokenBlocklist.revocation_cache()
+        # the worker pruned on its first refresh, the next prune is due an hour later
+        assert TokenBlocklist.query.count() == 2
+
+        cache = TokenBlocklist.revocation_cache()
+        cache.refreshed_at = cache.pruned_at = None
+        self.client.get('/admin', headers=header)
+        assert TokenBlocklist.query.count() == 1
+
+        db.session.add(TokenBlocklist(jti="expired", created_at=utcnow() - timedelta(days=1)))
+        db.session.commit()
+
+        assert TokenBlocklist.prune() == 1
+        assert TokenBlocklist.query.count() == 1
+
+    def test_password_rehash_on_login(self):
+        admin_signup_data = {
+            "first_name": "Test",
+            "last_name": "Admin",
+            "email": "testadmin@gmail.com"
+        }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+        assert admin.password.startswith(self.app.config["PASSWORD_HASH_METHOD"] + "$")
+
+        # a hash made with older parameters
+        admin.password = generate_password_hash("adminte", "pbkdf2:sha256:500")
+        db.session.commit()
+
+        data = {
+            "email": "testadmin@gmail.com",
+            "password": "adminte"
+        }
+
+        response = self.client.post('/admin/login', json=data)
+
+        assert response.status_code == 200
+        assert db.session.get(User, admin.id).password.startswith(self.app.config["PASSWORD_HASH_METHOD"] + "$")
+
+        response = self.client.post('/admin/login', json={"email": "nobody@gmail.com", "password": "x"})
+
+        assert response.status_code == 401
+
+    def test_password_hasher_pool(self):
+        # the first call waits for the pool process to start
+        hasher = PasswordHasher(workers=1, queue_size=0, timeout=10)
+        try:
+            pwhash = hasher.run(generate_password_hash, "secret", "pbkdf2:sha256:1000")
+            assert pwhash.startswith("pbkdf2:sha256:1000$")
+
+            # every slot is taken, so the call is refused after the timeout
+            hasher.timeout = 0.1
+            hasher.slots.acquire()
+            with self.assertRaises(ServiceUnavailable):
+                hasher.run(generate_password_hash, "secret", "pbkdf2:sha256:1000")
+            with self.assertRaises(ServiceUnavailable):
+                hasher.map(generate_password_hash, ["secret"], ["pbkdf2:sha256:1000"])
+            hasher.slots.release()
+
+            hasher.timeout = 10
+            pwhashes = hasher.map(generate_password_hash, ["a", "b", "c"], ["pbkdf2:sha256:1000"] * 3)
+            assert [check_password_hash(pwhash, password) for pwhash, password in zip(pwhashes, "abc")] == [True] * 3
+        finally:
+            hasher.pool.shutdown()
+
+    def test_email_outbox(self):
+        admin_signup_data = {
+            "first_name": "Test",
+            "last_name": "Admin",
+            "email": "testadmin@gmail.com"
+        }
+
+        with mail.record_messages() as outbox:
+            response = self.client.post('/admin/signup', json=admin_signup_data)
+
+            # the email is written with the signup and sent later
+            assert response.status_code == 201
+            assert outbox == []
+            email = EmailOutbox.query.one()
+            assert email.recipients == "testadmin@gmail.com"
+            assert email.status == "pending"
+
+            with mock.patch("flask_mail.Connection.send", side_effect=smtplib.SMTPRecipientsRefused({})):
+                assert EmailOutbox.send_pending() == 0
+            email = db.session.get(EmailOutbox, email.id)
+            assert email.status == "pending"
+            assert email.attempts == 1
+            assert EmailOutbox.send_pending() == 0
+
+            email.next_attempt_at = email.created_at
+            db.session.commit()
+
+            runner = self.app.test_cli_runner()
+            result = runner.invoke(args=["send-mail"])
+
+            assert result.output == "Sent 1 emails\n"
+            assert len(outbox) == 1
+            assert outbox[0].recipients == ["testadmin@gmail.com"]
+            # the body holds the default password, so sent emails are not kept
+            assert EmailOutbox.query.count() == 0
+
+    def test_login_rate_limit(self):
+        admin_signup_data = {
+            "first_name": "Test",
+            "last_name": "Admin",
+            "email": "testadmin@gmail.com"
+        }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        self.app.config["RATE_LIMITS"] = {**self.app.config["RATE_LIMITS"], "login": (2, 60)}
+        data = {
+            "email": "testadmin@gmail.com",
+            "password": "wrong"
+        }
+
+        for _ in range(2):
+            response = self.client.post('/admin/login', json=data)
+            assert response.status_code == 401
+
+        response = self.client.post('/admin/login', json=data)
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "30"
+
+        # another client address has its own bucket
+        response = self.client.post('/admin/login', json=data, environ_base={"REMOTE_ADDR": "10.0.0.2"})
+        assert response.status_code == 401
+
+        # and so has another account from the same address
+        response = self.client.post('/admin/login', json={**data, "email": "other@gmail.com"})
+        assert response.status_code == 401
+
+    def test_login_rate_limit_rotating_accounts(self):
+        self.app.config["RATE_LIMITS"] = {**self.app.config["RATE_LIMITS"], "login": (2, 60), "login_ip": (3, 60)}
+
+        # every email has a bucket of its own, but the client address runs out of its wider one
+        for number in range(3):
+            response = self.client.post('/admin/login', json={"email": f"user{number}@gmail.com", "password": "wrong"})
+            assert response.status_code == 401
+
+        response = self.client.post('/admin/login', json={"email": "user3@gmail.com", "password": "wrong"})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "20"
+
+        response = self.client.post(
+            '/admin/login',
+            json={"email": "user3@gmail.com", "password": "wrong"},
+            environ_base={"REMOTE_ADDR": "10.0.0.2"},
+        )
+        assert response.status_code == 401
+
+    def test_proxied_client_address(self):
+        class ProxiedConfig(config_dict['test']):
+            PROXY_FIX_X_FOR = 1
+
+        app = create_app(config=ProxiedConfig)
+        app.config["RATE_LIMITS"] = {**app.config["RATE_LIMITS"], "login": (1, 60)}
+        client = app.test_client()
+        data = {"email": "testadmin@gmail.com", "password": "wrong"}
+
+        with app.app_context():
+            db.create_all()
+            # every client reaches the app from the address of the router
+            response = client.post('/admin/login', json=data, headers={"X-Forwarded-For": "203.0.113.1"})
+            assert response.status_code == 401
+            response = client.post('/admin/login', json=data, headers={"X-Forwarded-For": "203.0.113.2"})
+            assert response.status_code == 401
+            response = client.post('/admin/login', json=data, headers={"X-Forwarded-For": "203.0.113.1"})
+            assert response.status_code == 429
+            db.drop_all()
+
+    def test_shared_rate_limit_backend(self):
+        backend = DatabaseBucketBackend(max_age=60)
+
+        assert backend.take("login:ip:127.0.0.1", 2, 60) == 0
+        assert backend.take("login:ip:127.0.0.1", 2, 60) == 0
+        assert 29 < backend.take("login:ip:127.0.0.1", 2, 60) <= 30
+        assert backend.take("login:ip:10.0.0.2", 2, 60) == 0
+
+        # idle buckets are full again and get swept
+        db.session.execute(db.update(RateLimitBucket).where(RateLimitBucket.key == "login:ip:10.0.0.2").values(updated_at=0))
+        db.session.commit()
+        backend.next_sweep = 0
+        assert backend.sweep() == 1
+        assert backend.sweep() == 0
+        assert db.session.scalars(db.select(RateLimitBucket.key)).all() == ["login:ip:127.0.0.1"]
@@ -4,6 +4,11 @@ from utils import db
 from config.config import config_dict
 from models.user import User
 from models.courses import Course
+from models.cache import CacheVersion
+from models.audit import AuditLog, audit_buffer
+from models.scores import Score
+from models.enrollment import is_enrolled, join_waitlist
+from models.waitlist import CourseWaitlist
 from flask_jwt_extended import create_access_token
 
 class CourseTestCase(unittest.TestCase):
@@ -44,6 +49,63 @@ class CourseTestCase(unittest.TestCase):
 
         assert response.status_code == 200
 
+    def test_course_catalog_etag(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        course_data = {
+            "name": "Physics",
+            "teacher": "Prof",
+            "unit": 1
+        }
+        self.client.post('/course', headers=headers, json=course_data)
+
+        response = self.client.get('/course', headers=headers)
+        etag = response.headers["ETag"]
+
+        assert len(response.json) == 1
+
+        response = self.client.get('/course', headers={**headers, "If-None-Match": etag})
+
+        assert response.status_code == 304
+
+        course_data_2 = {
+            "name": "Soft skills",
+            "teacher": "Fope Daniels",
+            "unit": 4
+        }
+        self.client.post('/course', headers=headers, json=course_data_2)
+
+        response = self.client.get('/course', headers={**headers, "If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert len(response.json) == 2
+
+        version = CacheVersion.get("course_catalog")
+        admin.courses.append(db.session.get(Course, 1))
+        db.session.commit()
+
+        assert CacheVersion.get("course_catalog") == version
+
+        db.session.get(Course, 1).teacher = "Another Prof"
+        db.session.commit()
+
+        assert CacheVersion.get("course_catalog") == version + 1
+
     def test_post_course(self):
         admin_signup_data = {
                     "first_name": "Test",
@@ -145,6 +207,10 @@ class CourseTestCase(unittest.TestCase):
 
         assert response.json["id"] == student.id
 
+        response = self.client.put('/course/1/enroll/2?include=courses', headers=headers)
+
+        assert len(response.json["courses"]) == 1
+
 
     def test_unenroll_student(self):
         admin_signup_data = {
@@ -188,6 +254,10 @@ class CourseTestCase(unittest.TestCase):
 
         assert response.json == {"Message": "Unenrolled student from course"}
 
+        response = self.client.put('/course/1/unenroll/2', headers=headers)
+
+        assert response.status_code == 400
+
     def test_student_course_list(self):
         admin_signup_data = {
                     "first_name": "Test",
@@ -347,3 +417,384 @@ class CourseTestCase(unittest.TestCase):
         assert response.json == {"message": "Result uploaded"}
         assert response.status_code == 201
 
+        response = self.client.put('/course/1/score-upload', headers=headers, json=student_score_data)
+
+        assert response.json == {"message": "Result updated"}
+        assert response.status_code == 202
+        assert Score.query.filter_by(user_id=student.id, course_id=1).count() == 1
+
+    def test_batch_score_upload(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        course_data = {
+            "name": "Physics",
+            "teacher": "Prof",
+            "unit": 2
+        }
+        self.client.post('/course', headers=headers, json=course_data)
+
+        for number in range(3):
+            data = {
+                "first_name": "test",
+                "last_name": f"user{number}",
+                "email": f"testuser{number}@gmail.com",
+                }
+            self.client.post('/students/signup', json=data, headers=headers)
+
+        student, student_2, student_3 = User.query.filter(User.is_admin != True).order_by(User.id).all()
+
+        self.client.put('/course/1/enroll/2', headers=headers)
+        self.client.put('/course/1/enroll/3', headers=headers)
+        self.client.put('/course/1/score-upload', headers=headers,
+                        json={"student_id": student.student_id, "score": 30})
+
+        data = {
+            "scores": [
+                {"student_id": student.student_id, "score": 70},
+                {"student_id": student_2.student_id, "score": 55},
+                {"student_id": student_3.student_id, "score": 80},
+                {"student_id": "STA/2023/0000", "score": 80},
+                {"student_id": student_2.student_id, "score": 65},
+            ]
+        }
+
+        response = self.client.put('/course/1/score-upload/batch', headers=headers, json=data)
+
+        assert response.status_code == 200
+        assert (response.json["created"], response.json["updated"], response.json["rejected"]) == (1, 1, 3)
+        assert [row["result"] for row in response.json["results"]] == ["updated", "created", "rejected", "rejected", "rejected"]
+
+        response = self.client.get(f'/student/{student.student_id}/scores', headers=headers)
+
+        assert response.json == [{"name": "Physics", "score": 70, "grade": "A"}]
+
+        response = self.client.get(f'/student/{student_2.student_id}/cgpa', headers=headers)
+
+        assert response.json == {"message": f"GPA for {student_2.student_id} is 3.0"}
+
+    def test_bulk_enroll(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        course_data = {
+            "name": "Physics",
+            "teacher": "Prof",
+            "unit": 1
+        }
+        course_data_2 = {
+            "name": "Soft skills",
+            "teacher": "Fope Daniels",
+            "unit": 4
+        }
+        self.client.post('/course', headers=headers, json=course_data)
+        self.client.post('/course', headers=headers, json=course_data_2)
+
+        for number in range(3):
+            data = {
+                "first_name": "test",
+                "last_name": f"user{number}",
+                "email": f"testuser{number}@gmail.com",
+                }
+            self.client.post('/students/signup', json=data, headers=headers)
+
+        self.client.put('/student/4', headers=headers, json={"enrollment_status": "expelled"})
+        self.client.put('/course/1/enroll/2', headers=headers)
+
+        response = self.client.put('/course/1/enroll', headers=headers, json={"ids": [1, 2, 3, 4, 99]})
+
+        assert response.status_code == 200
+        assert response.json == {"enrolled": [3], "waitlisted": [], "skipped": [1, 2, 4, 99]}
+
+        response = self.client.put('/student/2/enroll', headers=headers, json={"ids": [1, 2, 99]})
+
+        assert response.status_code == 200
+        assert response.json == {"enrolled": [2], "waitlisted": [], "skipped": [1, 99]}
+
+        response = self.client.put('/student/4/enroll', headers=headers, json={"ids": [1]})
+
+        assert response.status_code == 400
+
+        response = self.client.get('/course/1/students', headers=headers)
+
+        assert len(response.json) == 2
+
+    def test_course_statistics(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        course_data = {
+            "name": "Physics",
+            "teacher": "Prof",
+            "unit": 1
+        }
+        course_data_2 = {
+            "name": "Soft skills",
+            "teacher": "Fope Daniels",
+            "unit": 4
+        }
+        self.client.post('/course', headers=headers, json=course_data)
+        self.client.post('/course', headers=headers, json=course_data_2)
+
+        for number in range(4):
+            data = {
+                "first_name": "test",
+                "last_name": f"user{number}",
+                "email": f"testuser{number}@gmail.com",
+                }
+            self.client.post('/students/signup', json=data, headers=headers)
+
+        self.client.put('/course/1/enroll', headers=headers, json={"ids": [2, 3, 4, 5]})
+        students = User.query.filter(User.is_admin != True).order_by(User.id).all()
+        data = {
+            "scores": [
+                {"student_id": student.student_id, "score": score}
+                for student, score in zip(students, [80, 60, 30, 50])
+            ]
+        }
+        self.client.put('/course/1/score-upload/batch', headers=headers, json=data)
+
+        response = self.client.get('/course/1/stats?top=2', headers=headers)
+
+        assert response.status_code == 200
+        stats = response.json
+        assert (stats["count"], stats["mean"], stats["median"], stats["min"], stats["max"]) == (4, 55.0, 55.0, 30, 80)
+        assert stats["std"] == 18.03
+        assert stats["pass_rate"] == 0.75
+        assert stats["histogram"] == {"A": 1, "B": 1, "C": 1, "D": 0, "E": 0, "F": 1}
+        assert [row["score"] for row in stats["top"]] == [80, 60]
+        assert stats["top"][0]["student_id"] == students[0].student_id
+
+        # scores of deleted students and courses are left out
+        db.session.execute(db.insert(Score), [
+            {"score": 90, "grade": "A", "user_id": None, "course_id": 1},
+            {"score": 90, "grade": "A", "user_id": students[0].id, "course_id": 99},
+        ])
+        db.session.commit()
+
+        response = self.client.get('/course/stats', headers=headers)
+
+        assert response.status_code == 200
+        assert [course["count"] for course in response.json] == [4, 0]
+        assert response.json[0]["max"] == 80
+        assert response.json[1]["mean"] is None
+
+    def test_grading_scheme_regrade(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        course_data = {
+            "name": "Physics",
+            "teacher": "Prof",
+            "unit": 1
+        }
+        self.client.post('/course', headers=headers, json=course_data)
+
+        student_signup_data = {
+            "first_name": "test",
+            "last_name": "user",
+            "email": "testuser@gmail.com",
+            }
+        self.client.post('/students/signup', json=student_signup_data, headers=headers)
+
+        student = User.query.filter_by(email='testuser@gmail.com').first()
+
+        self.client.put('/course/1/enroll/2', headers=headers)
+        self.client.put('/course/1/score-upload', headers=headers,
+                        json={"student_id": student.student_id, "score": 65})
+
+        scheme_data = {
+            "name": "Strict",
+            "boundaries": [
+                {"grade": "A", "min_score": 80},
+                {"grade": "B", "min_score": 65},
+                {"grade": "C", "min_score": 50},
+                {"grade": "F", "min_score": 0},
+            ],
+        }
+
+        response = self.client.post('/grading-scheme', headers=headers, json=scheme_data)
+
+        assert response.status_code == 201
+        scheme_id = response.json["id"]
+
+        response = self.client.put('/course/1/grading-scheme', headers=headers, json={"grading_scheme_id": scheme_id})
+
+        assert response.status_code == 200
+
+        # stored grades only change once regraded
+        response = self.client.get(f'/student/{student.student_id}/scores', headers=headers)
+
+        assert response.json[0]["grade"] == "B"
+
+        scheme_data["boundaries"][1]["min_score"] = 70
+        response = self.client.put(f'/grading-scheme/{scheme_id}', headers=headers, json=scheme_data)
+
+        assert response.status_code == 200
+
+        response = self.client.post('/grading-scheme/regrade', headers=headers, json={"course_id": 1})
+
+        assert response.json == {"message": "Regraded 1 scores"}
+        audit_buffer().flush()
+        assert AuditLog.query.filter_by(action="regrade").one().details == {"course_id": 1, "grade": "C"}
+
+        response = self.client.get(f'/student/{student.student_id}/scores', headers=headers)
+
+        assert response.json[0]["grade"] == "C"
+
+        response = self.client.get(f'/student/{student.student_id}/cgpa', headers=headers)
+
+        assert response.json == {"message": f"GPA for {student.student_id} is 3.0"}
+
+        response = self.client.put('/course/1/score-upload', headers=headers,
+                                   json={"student_id": student.student_id, "score": 85})
+        response = self.client.get(f'/student/{student.student_id}/scores', headers=headers)
+
+        assert response.json[0]["grade"] == "A"
+
+        response = self.client.post('/grading-scheme', headers=headers, json={**scheme_data, "name": "Lenient"})
+
+        assert response.status_code == 201
+
+        response = self.client.put(f'/grading-scheme/{response.json["id"]}', headers=headers, json=scheme_data)
+
+        assert response.status_code == 409
+
+    def test_course_capacity_waitlist(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        course_data = {
+            "name": "Physics",
+            "teacher": "Prof",
+            "unit": 1,
+            "capacity": 2
+        }
+        self.client.post('/course', headers=headers, json=course_data)
+
+        for number in range(5):
+            data = {
+                "first_name": "test",
+                "last_name": f"user{number}",
+                "email": f"testuser{number}@gmail.com",
+                }
+            self.client.post('/students/signup', json=data, headers=headers)
+
+        response = self.client.put('/course/1/enroll/2', headers=headers)
+
+        assert response.status_code == 200
+
+        response = self.client.put('/course/1/enroll', headers=headers, json={"ids": [4, 3, 5]})
+
+        assert response.json == {"enrolled": [4], "waitlisted": [3, 5], "skipped": []}
+
+        response = self.client.put('/course/1/enroll/6', headers=headers)
+
+        assert response.status_code == 202
+        assert response.json["position"] == 3
+
+        response = self.client.put('/course/1/unenroll/2', headers=headers)
+
+        assert response.status_code == 200
+        assert is_enrolled(3, 1)
+
+        response = self.client.get('/course/1/waitlist', headers=headers)
+
+        assert response.json["enrolled_count"] == 2
+        assert len(response.json["waitlist"]) == 2
+
+        response = self.client.put('/course/1/capacity', headers=headers, json={"capacity": 3})
+
+        assert response.json["promoted"] == [5]
+
+        response = self.client.get('/course/1/students', headers=headers)
+
+        assert len(response.json) == 3
+
+        response = self.client.get('/course/1/waitlist', headers=headers)
+
+        assert (response.json["capacity"], response.json["enrolled_count"]) == (3, 3)
+        assert [row["position"] for row in response.json["waitlist"]] == [1]
+
+        # students already waiting, e.g. added by a concurrent enrollment, are skipped
+        join_waitlist([6, 2], 1)
+        join_waitlist([6, 2], 1)
+        db.session.commit()
+
+        assert db.session.scalars(
+            db.select(CourseWaitlist.user_id).where(CourseWaitlist.course_id == 1).order_by(CourseWaitlist.id)
+        ).all() == [6, 2]
+
+        # bulk enrollments and promotions are audited for every student
+        audit_buffer().flush()
+        events = db.session.execute(
+            db.select(AuditLog.action, AuditLog.target_id).where(AuditLog.action != "enroll").order_by(AuditLog.id)
+        ).all()
+        assert events == [
+            ("waitlist", 3), ("waitlist", 5), ("waitlist", 6), ("unenroll", 2), ("promote", 3), ("promote", 5),
+        ]
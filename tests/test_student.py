@@ -1,10 +1,21 @@
 import unittest
+from unittest import mock
+import csv
+import io
+import json
 from app import create_app
 from utils import db
 from config.config import config_dict
-from models.user import User
+from models.user import User, student_course
 from models.courses import Course
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, decode_token
+from models.principal import principal_cache
+from models.outbox import EmailOutbox
+from models.audit import AuditLog, audit_buffer
+from models.student_id import generate_student_id, generate_student_ids
+from datetime import date
+from sqlalchemy import event, insert
+from werkzeug.exceptions import ServiceUnavailable
 
 class StudentTestCase(unittest.TestCase):
     def setUp(self):
@@ -44,6 +55,130 @@ class StudentTestCase(unittest.TestCase):
 
         assert response.json == []
 
+    def test_get_students_paginated(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        for number in range(5):
+            data = {
+                "first_name": "test",
+                "last_name": f"user{number}",
+                "email": f"testuser{number}@gmail.com",
+                }
+            self.client.post('/students/signup', json=data, headers=headers)
+
+        response = self.client.get('/student?limit=2', headers=headers)
+
+        assert response.status_code == 200
+        assert [student["email"] for student in response.json] == ['testuser0@gmail.com', 'testuser1@gmail.com']
+
+        next_cursor = json.loads(response.headers["X-Pagination"])["next"]
+        response = self.client.get(f'/student?limit=2&cursor={next_cursor}', headers=headers)
+
+        assert [student["email"] for student in response.json] == ['testuser2@gmail.com', 'testuser3@gmail.com']
+
+        response = self.client.get('/student?enrollment_status=active', headers=headers)
+
+        assert response.json == []
+
+        response = self.client.get('/student?cursor=invalid', headers=headers)
+
+        assert response.status_code == 400
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        try:
+            response = self.client.get('/student?limit=2&sort=date_created&fields=id,student_id,enrollment_status', headers=headers)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+
+        assert response.status_code == 200
+        assert sorted(response.json[0]) == ["enrollment_status", "id", "student_id"]
+        # the page query selects only the fields asked for and the sort columns
+        assert len(statements) == 1
+        assert "password" not in statements[0] and "email" not in statements[0]
+
+        next_cursor = json.loads(response.headers["X-Pagination"])["next"]
+        response = self.client.get(f'/student?limit=2&sort=date_created&cursor={next_cursor}&fields=email', headers=headers)
+
+        assert response.json == [{"email": "testuser2@gmail.com"}, {"email": "testuser3@gmail.com"}]
+
+        response = self.client.get('/student?fields=password', headers=headers)
+
+        assert response.status_code == 422
+
+    def test_get_students_query_count(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        db.session.execute(insert(Course), [
+            {"name": "Physics", "teacher": "Prof", "unit": 1},
+            {"name": "Soft skills", "teacher": "Fope Daniels", "unit": 4},
+        ])
+        db.session.execute(insert(User), [
+            {
+                "first_name": "test",
+                "last_name": f"user{number}",
+                "email": f"testuser{number}@gmail.com",
+                "password": "password",
+                "student_id": f"STA/2023/{number}",
+            }
+            for number in range(1000)
+        ])
+        db.session.execute(insert(student_course), [
+            {"user_id": user_id, "course_id": course_id}
+            for user_id in range(2, 1002)
+            for course_id in (1, 2)
+        ])
+        db.session.commit()
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        try:
+            response = self.client.get('/student?limit=1000&include=courses', headers=headers)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+
+        assert response.status_code == 200
+        assert len(response.json) == 1000
+        assert len(response.json[0]["courses"]) == 2
+        # blocklist checks, the page itself and the course loads batched 500 students at a time
+        assert len(statements) <= 5
+
     def test_get_student_by_id(self):
         admin_signup_data = {
                     "first_name": "Test",
@@ -299,4 +434,471 @@ class StudentTestCase(unittest.TestCase):
 
         assert response.status_code == 200
 
-    
\ No newline at end of file
+        assert response.json == {"message": f"GPA for {student.student_id} is 3.4"}
+
+        # regrading one course and dropping the other keeps the totals in step
+        student_score_data_3 = {
+            "student_id": student.student_id,
+            "score": 45,
+            }
+        self.client.put('/course/1/score-upload', headers=headers, json=student_score_data_3)
+        self.client.put('/course/2/unenroll/2', headers=headers)
+
+        response = self.client.get(f'/student/{student.student_id}/cgpa', headers=headers)
+
+        assert response.json == {"message": f"GPA for {student.student_id} is 2.0"}
+
+        User.query.filter_by(id=student.id).update({"total_units": 0, "total_grade_points": 0})
+        db.session.commit()
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=["rebuild-gpa", "--check"])
+
+        assert result.exit_code != 0
+
+        result = runner.invoke(args=["rebuild-gpa"])
+
+        assert result.exit_code == 0
+        assert db.session.get(User, student.id).gpa == 2.0
+
+    def test_principal_cache(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        student_signup_data = {
+            "first_name": "test",
+            "last_name": "user",
+            "email": "testuser@gmail.com",
+            }
+        response = self.client.post('/students/signup', json=student_signup_data, headers=headers)
+
+        student = User.query.filter_by(email='testuser@gmail.com').first()
+
+        student_token = create_access_token(identity=student.id, additional_claims={"is_administrator": False})
+
+        student_headers = {
+            "Authorization": f"Bearer {student_token}"
+        }
+
+        response = self.client.get(f'/student/{student.student_id}/cgpa', headers=student_headers)
+        assert response.status_code == 200
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        try:
+            response = self.client.get(f'/student/{student.student_id}/cgpa', headers=student_headers)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+
+        assert response.status_code == 200
+        # only the student is loaded, the caller and the blocklist come from the caches
+        assert len(statements) == 1
+
+        response = self.client.put(f'/student/{student.id}', headers=headers, json={"enrollment_status": "expelled"})
+        assert principal_cache().get(student.id) is None
+
+        self.app.config["SUPER_ADMIN_EMAIL"] = "testadmin@gmail.com"
+        assert decode_token(create_access_token(identity=admin.id))["super_admin"] is True
+        assert decode_token(create_access_token(identity=student.id))["super_admin"] is False
+
+    
+    def test_student_score_sheets(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        course_data = {
+            "name": "Physics",
+            "teacher": "Prof",
+            "unit": 1
+        }
+        course_data_2 = {
+            "name": "Soft skills",
+            "teacher": "Fope Daniels",
+            "unit": 4
+        }
+
+        self.client.post('/course', headers=headers, json=course_data)
+        self.client.post('/course', headers=headers, json=course_data_2)
+
+        student_signup_data = {
+            "first_name": "test",
+            "last_name": "user",
+            "email": "testuser@gmail.com",
+            }
+        student_signup_data_2 = {
+            "first_name": "test",
+            "last_name": "student",
+            "email": "teststudent@gmail.com",
+        }
+        self.client.post('/students/signup', json=student_signup_data, headers=headers)
+        self.client.post('/students/signup', json=student_signup_data_2, headers=headers)
+
+        student = User.query.filter_by(email='testuser@gmail.com').first()
+        student_2 = User.query.filter_by(email='teststudent@gmail.com').first()
+
+        self.client.put('/course/1/enroll/2', headers=headers)
+        self.client.put('/course/2/enroll/2', headers=headers)
+
+        student_score_data = {
+            "student_id": student.student_id,
+            "score": 70,
+            }
+
+        self.client.put('/course/1/score-upload', headers=headers, json=student_score_data)
+
+        data = {
+            "student_ids": [student.student_id, student_2.student_id, "STA/2023/0000"]
+        }
+
+        response = self.client.post('/student/scores', headers=headers, json=data)
+
+        assert response.status_code == 200
+        assert response.json["scores"][student.student_id] == [
+            {"name": "Physics", "score": 70, "grade": "A"},
+            {"name": "Soft skills", "score": None, "grade": None},
+        ]
+        assert response.json["scores"][student_2.student_id] == []
+        assert response.json["not_found"] == ["STA/2023/0000"]
+
+    def test_student_rankings(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        course_data = {
+            "name": "Physics",
+            "teacher": "Prof",
+            "unit": 1
+        }
+        course_data_2 = {
+            "name": "Soft skills",
+            "teacher": "Fope Daniels",
+            "unit": 4
+        }
+
+        self.client.post('/course', headers=headers, json=course_data)
+        self.client.post('/course', headers=headers, json=course_data_2)
+
+        scores = {2: (70, 50), 3: (50, 70), 4: (70, 50)}
+        for number, (physics_score, soft_skills_score) in scores.items():
+            data = {
+                "first_name": "test",
+                "last_name": f"user{number}",
+                "email": f"testuser{number}@gmail.com",
+                }
+            self.client.post('/students/signup', json=data, headers=headers)
+            student = User.query.filter_by(email=f'testuser{number}@gmail.com').first()
+            self.client.put(f'/course/1/enroll/{number}', headers=headers)
+            self.client.put(f'/course/2/enroll/{number}', headers=headers)
+            self.client.put('/course/1/score-upload', headers=headers,
+                            json={"student_id": student.student_id, "score": physics_score})
+            self.client.put('/course/2/score-upload', headers=headers,
+                            json={"student_id": student.student_id, "score": soft_skills_score})
+
+        top_student = User.query.filter_by(email='testuser3@gmail.com').first()
+
+        response = self.client.get('/student/rankings?limit=2', headers=headers)
+
+        assert response.status_code == 200
+        assert response.json[0] == {
+            "student_id": top_student.student_id, "gpa": 4.6, "rank": 1, "dense_rank": 1, "percentile": 100.0
+        }
+        assert [(row["gpa"], row["rank"], row["dense_rank"]) for row in response.json] == [(4.6, 1, 1), (3.4, 2, 2)]
+
+        next_cursor = json.loads(response.headers["X-Pagination"])["next"]
+        response = self.client.get(f'/student/rankings?limit=2&cursor={next_cursor}', headers=headers)
+
+        assert [(row["gpa"], row["rank"], row["dense_rank"]) for row in response.json] == [(3.4, 2, 2)]
+
+        response = self.client.get('/student/rankings?course_id=1&top=1', headers=headers)
+
+        assert [row["rank"] for row in response.json] == [1, 1]
+
+        self.client.post('/course', headers=headers, json={"name": "Seminar", "teacher": "Prof", "unit": 0})
+        self.client.put('/course/3/enroll/2', headers=headers)
+        student = User.query.filter_by(email='testuser2@gmail.com').first()
+        self.client.put('/course/3/score-upload', headers=headers,
+                        json={"student_id": student.student_id, "score": 80})
+
+        response = self.client.get('/student/rankings?course_id=3', headers=headers)
+
+        assert response.status_code == 200
+        assert response.json == []
+
+    def test_student_roster_export(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        course_data = {
+            "name": "Physics",
+            "teacher": "Prof",
+            "unit": 1
+        }
+        course_data_2 = {
+            "name": "Soft skills",
+            "teacher": "Fope Daniels",
+            "unit": 4
+        }
+
+        self.client.post('/course', headers=headers, json=course_data)
+        self.client.post('/course', headers=headers, json=course_data_2)
+
+        student_signup_data = {
+            "first_name": "test",
+            "last_name": "user",
+            "email": "testuser@gmail.com",
+            }
+        student_signup_data_2 = {
+            "first_name": "test",
+            "last_name": "student",
+            "email": "teststudent@gmail.com",
+        }
+        self.client.post('/students/signup', json=student_signup_data, headers=headers)
+        self.client.post('/students/signup', json=student_signup_data_2, headers=headers)
+
+        self.client.put('/course/1/enroll/2', headers=headers)
+        self.client.put('/course/2/enroll/2', headers=headers)
+
+        response = self.client.get('/student/export', headers=headers)
+
+        assert response.status_code == 200
+        assert response.mimetype == "text/csv"
+        lines = response.get_data(as_text=True).splitlines()
+        assert lines[0] == "id,student_id,first_name,last_name,email,enrollment_status,courses"
+        assert lines[1].endswith(",testuser@gmail.com,in_waitlist,Physics;Soft skills")
+        assert lines[2].endswith(",teststudent@gmail.com,in_waitlist,")
+
+        response = self.client.get('/student/export?format=ndjson', headers=headers)
+
+        students = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [student["courses"] for student in students] == [["Physics", "Soft skills"], []]
+
+    def test_bulk_change_enrollment_status(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        for number in range(3):
+            data = {
+                "first_name": "test",
+                "last_name": f"user{number}",
+                "email": f"testuser{number}@gmail.com",
+                }
+            self.client.post('/students/signup', json=data, headers=headers)
+
+        self.client.put('/student/4', headers=headers, json={"enrollment_status": "expelled"})
+
+        data = {
+            "ids": [1, 2, 3, 4, 99],
+            "enrollment_status": "active",
+        }
+
+        response = self.client.put('/student/enrollment-status', headers=headers, json=data)
+
+        assert response.status_code == 200
+        assert (response.json["updated"], response.json["unchanged"], response.json["rejected"]) == (2, 0, 3)
+        assert [(result["id"], result["result"]) for result in response.json["results"]] == [
+            (2, "updated"), (3, "updated"), (4, "rejected"), (1, "rejected"), (99, "rejected")
+        ]
+        assert User.query.filter_by(enrollment_status="ACTIVE").count() == 2
+        assert db.session.get(User, 1).enrollment_status.value == "admin"
+
+        data = {
+            "current_status": "active",
+            "enrollment_status": "in_waitlist",
+        }
+
+        response = self.client.put('/student/enrollment-status', headers=headers, json=data)
+
+        assert response.json["updated"] == 2
+        audit_buffer().flush()
+        assert db.session.execute(
+            db.select(AuditLog.target_id, AuditLog.details).where(AuditLog.action == "change_status").order_by(AuditLog.id)
+        ).all()[-4:] == [(id, {"enrollment_status": status}) for status in ("active", "in_waitlist") for id in (2, 3)]
+
+        response = self.client.put('/student/enrollment-status', headers=headers, json={"enrollment_status": "active"})
+
+        assert response.status_code == 422
+
+        response = self.client.put('/student/2', headers=headers, json={"enrollment_status": "admin"})
+
+        assert response.status_code == 422
+
+    def test_student_import(self):
+        admin_signup_data = {
+                    "first_name": "Test",
+                    "last_name": "Admin",
+                    "email": "testadmin@gmail.com"
+                }
+
+        response = self.client.post('/admin/signup', json=admin_signup_data)
+
+        admin = User.query.filter_by(email='testadmin@gmail.com').first()
+
+        token = create_access_token(identity=admin.id, additional_claims={"is_administrator": True})
+
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        student_signup_data = {
+            "first_name": "test",
+            "last_name": "user",
+            "email": "testuser@gmail.com",
+            }
+        response = self.client.post('/students/signup', json=student_signup_data, headers=headers)
+
+        # chunks of two rows, so duplicates are also found across chunks
+        self.app.config["STUDENT_IMPORT_CHUNK_SIZE"] = 2
+        upload = (
+            "first_name,last_name,email\n"
+            "Ada,Obi,ada@gmail.com\n"
+            "test,user,testuser@gmail.com\n"
+            "Ada,Obi,ada@gmail.com\n"
+            "Bola,,bola@gmail.com\n"
+            "Chi,Eze,chi@gmail.com\n"
+        )
+        response = self.client.post(
+            '/student/import',
+            headers=headers,
+            data={"file": (io.BytesIO(upload.encode()), "students.csv")},
+            content_type="multipart/form-data",
+        )
+
+        assert response.status_code == 200
+        report = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert [(row["row"], row["result"]) for row in report] == [
+            ("2", "created"),
+            ("3", "exists"),
+            ("4", "exists"),
+            ("5", "invalid"),
+            ("6", "created"),
+        ]
+        ada = User.query.filter_by(email="ada@gmail.com").one()
+        assert report[0]["student_id"] == ada.student_id
+        assert EmailOutbox.query.filter_by(recipients="ada@gmail.com").count() == 1
+
+        login_data = {
+            "student_id": ada.student_id,
+            "password": "obiad"
+        }
+        response = self.client.post('/student/login', json=login_data)
+        assert response.status_code == 200
+
+        runner = self.app.test_cli_runner()
+        with runner.isolated_filesystem():
+            with open("students.csv", "w") as file:
+                file.write("first_name,last_name,email\nDayo,Ade,dayo@gmail.com\nDayo,Ade,dayo@gmail.com\n")
+            result = runner.invoke(args=["import-students", "students.csv"])
+
+        report = list(csv.DictReader(io.StringIO(result.output)))
+        assert [row["result"] for row in report] == ["created", "duplicate"]
+
+        # rows that keep failing to insert are reported instead of cutting the report off
+        with mock.patch("student.importer.generate_student_ids", return_value=[ada.student_id]):
+            with runner.isolated_filesystem():
+                with open("students.csv", "w") as file:
+                    file.write("first_name,last_name,email\nEbun,Ola,ebun@gmail.com\n")
+                result = runner.invoke(args=["import-students", "students.csv"])
+
+        assert result.exit_code == 0
+        report = list(csv.DictReader(io.StringIO(result.output)))
+        assert [(row["email"], row["result"]) for row in report] == [("ebun@gmail.com", "error")]
+        assert User.query.filter_by(email="ebun@gmail.com").count() == 0
+
+        # a busy password hasher fails the chunk, not the rest of the import
+        self.app.config["STUDENT_IMPORT_CHUNK_SIZE"] = 1
+        with mock.patch("student.importer.hash_passwords", side_effect=[ServiceUnavailable(), ["hash"]]):
+            with runner.isolated_filesystem():
+                with open("students.csv", "w") as file:
+                    file.write("first_name,last_name,email\nFemi,Ola,femi@gmail.com\nGbenga,Ola,gbenga@gmail.com\n")
+                result = runner.invoke(args=["import-students", "students.csv"])
+
+        assert result.exit_code == 0
+        report = list(csv.DictReader(io.StringIO(result.output)))
+        assert [(row["email"], row["result"]) for row in report] == [
+            ("femi@gmail.com", "error"),
+            ("gbenga@gmail.com", "created"),
+        ]
+        assert User.query.filter_by(email="femi@gmail.com").count() == 0
+
+    def test_student_id_sequence(self):
+        year = date.today().year
+
+        assert generate_student_id() == f"STA/{year}/10000"
+        assert generate_student_id() == f"STA/{year}/10001"
+        # a bulk import reserves its whole range at once
+        assert generate_student_ids(3) == [f"STA/{year}/10002", f"STA/{year}/10003", f"STA/{year}/10004"]
+        db.session.commit()
+
+        # numbers taken by a rolled back transaction are handed out again
+        generate_student_ids(5)
+        db.session.rollback()
+        assert generate_student_id() == f"STA/{year}/10005"
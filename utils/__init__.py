@@ -1,18 +1,11 @@
 from .db import db
 from .mail import mail
-from datetime import date
-import random
+from .pagination import keyset_paginate, pagination_header
 from flask_jwt_extended import verify_jwt_in_request, get_jwt
 from functools import wraps
 from flask import jsonify
 
 
-def generate_student_id():
-    student_info = ["STA", str(date.today().year), str(random.randint(1000, 9999))]
-    student_id = "/".join(student_info)
-    return student_id
-
-
 def admin_required():
     def wrapper(fn):
         @wraps(fn)
@@ -45,17 +38,23 @@ def super_admin_required():
     return wrapper
 
 
+GRADE_POINTS = {"A": 5, "B": 4, "C": 3, "D": 2, "E": 1, "F": 0}
+
+
+# lowest score of each grade, used when no grading scheme is stored
+DEFAULT_GRADE_BOUNDARIES = [(70, "A"), (60, "B"), (50, "C"), (45, "D"), (40, "E"), (0, "F")]
+
+
+def score_to_grade(score: int, boundaries=DEFAULT_GRADE_BOUNDARIES) -> str:
+    """
+    Returns the grade of the highest boundary the score reaches.
+    Boundaries are (min_score, grade) pairs sorted from the highest min_score.
+    """
+    for min_score, grade in boundaries:
+        if score >= min_score:
+            return grade
+    return "F"
+
+
 def grade_to_point_converter(grade: str) -> int:
-    if grade == "A":
-        point = 5
-    elif grade == "B":
-        point = 4
-    elif grade == "C":
-        point = 3
-    elif grade == "D":
-        point = 2
-    elif grade == "E":
-        point = 1
-    else:
-        point = 0
-    return point
+    return GRADE_POINTS.get(grade, 0)
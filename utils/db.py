@@ -1,3 +1,115 @@
+import os
+import threading
+import time
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, exc
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.pool import QueuePool
 
-db = SQLAlchemy()
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that counts checkouts and the time they waited for a connection, and timeouts
+    with the time they waited apart. Opening a new connection is not waiting, so its time is left out
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.local = threading.local()
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.timeout_wait_total = 0.0
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            self.local.connecting += time.perf_counter() - started
+
+    def _do_get(self):
+        # QueuePool retries by calling _do_get again, which the outer call times
+        if getattr(self.local, "checking_out", False):
+            return super()._do_get()
+        self.local.checking_out = True
+        self.local.connecting = 0.0
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+                self.timeout_wait_total += time.perf_counter() - started - self.local.connecting
+            raise
+        finally:
+            self.local.checking_out = False
+        waited = time.perf_counter() - started - self.local.connecting
+        with self.stats_lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return connection
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_seconds_mean": self.wait_total / self.checkouts if self.checkouts else 0.0,
+                "wait_seconds_max": self.wait_max,
+                "timeouts": self.timeouts,
+                "timeout_wait_seconds_mean": self.timeout_wait_total / self.timeouts if self.timeouts else 0.0,
+            }
+
+
+# in-memory SQLite databases keep the StaticPool Flask-SQLAlchemy gives them
+db = SQLAlchemy(engine_options={"poolclass": TimedQueuePool})
+
+
+def dialect_insert(table, dialect):
+    """
+    Returns the insert construct of a dialect, which has the ON CONFLICT clauses of upserts
+    """
+    if dialect.name == "postgresql":
+        return postgresql.insert(table)
+    if dialect.name == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upserts are not supported on {dialect.name}")
+
+
+def configure_engine(app):
+    """
+    Applies SQLITE_PRAGMAS to every new SQLite connection of the app
+    """
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in app.config["SQLITE_PRAGMAS"].items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def pool_status():
+    """
+    Reports the connection pool of this worker
+    """
+    pool = db.engine.pool
+    status = {"worker": os.getpid(), "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+            timeout=pool.timeout(),
+        )
+    if isinstance(pool, TimedQueuePool):
+        status.update(pool.stats())
+    return status
@@ -0,0 +1,59 @@
+import base64
+import json
+from datetime import datetime
+from flask_smorest import abort
+from sqlalchemy import DateTime, tuple_
+from http import HTTPStatus
+
+
+def encode_cursor(values):
+    """
+    Encodes the sort key of the last row of a page into an opaque cursor
+    """
+    payload = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, columns):
+    """
+    Decodes a cursor back into values comparable with the sort columns
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        abort(HTTPStatus.BAD_REQUEST, message="Invalid cursor")
+
+
+def keyset_paginate(query, columns, limit, cursor=None, descending=False):
+    """
+    Returns a page of rows and the cursor of the next page.
+    The last sort column must be unique so the ordering is stable. Rows are
+    seeked with a row value comparison so page cost does not grow with depth.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        if descending:
+            query = query.filter(tuple_(*columns) < tuple_(*values))
+        else:
+            query = query.filter(tuple_(*columns) > tuple_(*values))
+    ordering = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+
+    next_cursor = None
+    # an extra row was fetched only to know whether there is a next page
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
+
+
+def pagination_header(next_cursor, limit):
+    return {"X-Pagination": json.dumps({"next": next_cursor, "limit": limit})}
@@ -0,0 +1,121 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from http import HTTPStatus
+from flask import current_app
+from flask_smorest import abort
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasher:
+    """
+    Runs password hashing on a bounded process pool so that it does not hold request
+    workers. Calls beyond the pool and its queue wait up to the timeout and are then refused.
+    Bulk hashing keeps at most half of the workers busy, so logins are served alongside it.
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.timeout = timeout
+        self.pool = None
+        if workers:
+            # the pool process is started from a fresh server process, never forked from a threaded worker
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            self.slots = threading.BoundedSemaphore(workers + queue_size)
+            self.bulk_slots = threading.BoundedSemaphore(max(workers // 2, 1))
+            atexit.register(self.pool.shutdown, cancel_futures=True)
+
+    def acquire(self, slots):
+        if not slots.acquire(timeout=self.timeout):
+            abort(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                message="Too many password checks in progress. Try again later",
+                headers={"Retry-After": "1"},
+            )
+
+    def submit(self, fn, *args):
+        self.acquire(self.slots)
+        try:
+            future = self.pool.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        # the slot is held until the hash is done, even if the request gave up waiting
+        future.add_done_callback(lambda future: self.slots.release())
+        return future
+
+    def result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            abort(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                message="Password check timed out. Try again later",
+                headers={"Retry-After": "1"},
+            )
+
+    def map(self, fn, *iterables):
+        """
+        Runs a call for every item, each taking a slot of the pool and a bulk slot
+        """
+        if self.pool is None:
+            return list(map(fn, *iterables))
+        futures = []
+        for args in zip(*iterables):
+            self.acquire(self.bulk_slots)
+            try:
+                future = self.submit(fn, *args)
+            except BaseException:
+                self.bulk_slots.release()
+                raise
+            future.add_done_callback(lambda future: self.bulk_slots.release())
+            futures.append(future)
+        return [self.result(future) for future in futures]
+
+    def run(self, fn, *args):
+        if self.pool is None:
+            return fn(*args)
+        return self.result(self.submit(fn, *args))
+
+
+hasher_lock = threading.Lock()
+
+
+def password_hasher():
+    hasher = current_app.extensions.get("password_hasher")
+    if hasher is None:
+        with hasher_lock:
+            hasher = current_app.extensions.get("password_hasher")
+            if hasher is None:
+                hasher = PasswordHasher(
+                    current_app.config["PASSWORD_HASH_WORKERS"],
+                    current_app.config["PASSWORD_HASH_QUEUE_SIZE"],
+                    current_app.config["PASSWORD_HASH_TIMEOUT"],
+                )
+                current_app.extensions["password_hasher"] = hasher
+    return hasher
+
+
+def hash_password(password):
+    return password_hasher().run(generate_password_hash, password, current_app.config["PASSWORD_HASH_METHOD"])
+
+
+def hash_passwords(passwords):
+    method = current_app.config["PASSWORD_HASH_METHOD"]
+    return password_hasher().map(generate_password_hash, passwords, [method] * len(passwords))
+
+
+def check_password(pwhash, password):
+    return password_hasher().run(check_password_hash, pwhash, password)
+
+
+def default_password(user_data):
+    return (user_data["last_name"] + user_data["first_name"][0:2]).lower()
+
+
+def password_needs_rehash(pwhash):
+    """
+    Checks if a hash was made with other parameters than the PASSWORD_HASH_METHOD
+    """
+    return pwhash.split("$", 1)[0] != current_app.config["PASSWORD_HASH_METHOD"]
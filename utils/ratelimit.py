@@ -0,0 +1,98 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from http import HTTPStatus
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
+from flask_smorest import abort
+
+
+class MemoryBucketBackend:
+    """
+    Token buckets kept by this worker. The least recently used buckets are dropped past max_size
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, per):
+        """
+        Takes a token from a bucket. Returns 0 if one was free, else the seconds until one is
+        """
+        rate = capacity / per
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            retry_after = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_size:
+                self.buckets.popitem(last=False)
+        return retry_after
+
+
+def rate_limit_backend():
+    backend = current_app.extensions.get("rate_limit_backend")
+    if backend is None:
+        backend = MemoryBucketBackend()
+        current_app.extensions["rate_limit_backend"] = backend
+    return backend
+
+
+def rate_limit_buckets(name, account=None):
+    """
+    The (limit name, key) pairs of the buckets a request takes from. That is the identity of the
+    caller if the route verified a jwt, else the client address together with the account field of
+    the json body, so that one client cannot use up the bucket of others. The client address then
+    also takes from the wider "<name>_ip" bucket, so that rotating accounts does not lift the limit
+    """
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        identity = None
+    if identity is not None:
+        return [(name, f"user:{identity}")]
+    address = f"ip:{request.remote_addr}"
+    if not account:
+        return [(name, address)]
+    value = (request.get_json(silent=True) or {}).get(account)
+    return [
+        (name, f"{address}:{account}:{str(value).strip().lower()[:100]}"),
+        (f"{name}_ip", address),
+    ]
+
+
+def rate_limit(name, account=None):
+    """
+    Limits a route with the token bucket of RATE_LIMITS[name], a (requests, per seconds) pair.
+    Place it under jwt_required so that callers are limited by identity. Routes without a jwt
+    can name the account field of their body to limit each account of a client on its own,
+    within the RATE_LIMITS[name + "_ip"] bucket of the client
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            retry_after = 0
+            for bucket, key in rate_limit_buckets(name, account):
+                limit = current_app.config["RATE_LIMITS"].get(bucket)
+                if limit:
+                    retry_after = max(retry_after, rate_limit_backend().take(f"{bucket}:{key}", *limit))
+            if retry_after:
+                abort(
+                    HTTPStatus.TOO_MANY_REQUESTS,
+                    message="Too many requests. Try again later",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+            return fn(*args, **kwargs)
+
+        return decorator
+
+    return wrapper